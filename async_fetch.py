@@ -0,0 +1,236 @@
+import asyncio
+import collections
+import json
+import os
+import random
+import time
+
+import aiohttp
+import pandas as pd
+
+from fast_decode import decode_payload
+from fiscal_units import FIRST_YEAR_BE, get_current_year_be, get_province_codes
+from metrics import BYTES_BUCKETS, ROWS_BUCKETS, METRICS, log
+from response_cache import ResponseCache
+from run_manifest import RunManifest
+from schema import apply_raw_schema
+
+# MOPH_API_URL points the fetch code at another server, e.g. the local stand-in in mock_api.py
+API_URL = os.environ.get('MOPH_API_URL', "https://opendata.moph.go.th/api/report_data")
+HEADERS = {"Content-Type": "application/json"}
+
+# Number of requests in flight at once; also the size of the keep-alive pool
+DEFAULT_MAX_CONCURRENCY = 20
+MIN_CONCURRENCY = 2
+REQUEST_TIMEOUT = 120  # seconds, per request
+
+# Transient failures (429, 5xx, dropped connections, timeouts) are retried with
+# exponential backoff and full jitter: sleep uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0  # seconds
+BACKOFF_MAX = 60.0  # seconds
+# AIMD: the concurrency limit is multiplied by this on 429/5xx, at most once per cooldown
+DECREASE_FACTOR = 0.5
+DECREASE_COOLDOWN = 2.0  # seconds
+
+class IncompleteFetchError(RuntimeError):
+    # Raised instead of returning a partial dataset; the run manifest keeps the done units
+    def __init__(self, missing_units):
+        self.missing_units = missing_units
+        super().__init__(f"{len(missing_units)} units could not be fetched: "
+                         f"{', '.join('/'.join(map(str, unit)) for unit in missing_units[:10])}"
+                         f"{' ...' if len(missing_units) > 10 else ''}")
+
+class AdaptiveLimiter:
+    # Concurrency limit adjusted AIMD-style: +1/limit per successful request (about +1 per
+    # round of requests), x DECREASE_FACTOR when the API answers 429/5xx or times out
+    def __init__(self, limit, min_limit=MIN_CONCURRENCY, decrease_factor=DECREASE_FACTOR,
+                 cooldown=DECREASE_COOLDOWN):
+        self.max_limit = limit
+        self.min_limit = min(min_limit, limit)
+        self.limit = float(limit)
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._waiters = collections.deque()
+        self._last_decrease = float('-inf')
+
+    def _wake(self):
+        # Hands free slots to waiters in FIFO order, like asyncio.Semaphore; a woken
+        # waiter already owns its slot
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    async def __aenter__(self):
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.in_flight -= 1
+                self._wake()
+            raise
+
+    async def __aexit__(self, *exc_info):
+        self.in_flight -= 1
+        self._wake()
+
+    def on_success(self):
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake()
+
+    def on_overload(self):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        METRICS.increment('concurrency_decreases')
+        log(f"API overloaded, concurrency limit lowered to {int(self.limit)}.", level='warning')
+
+def backoff_delay(attempt, retry_after=None):
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    return max(delay, retry_after) if retry_after else delay
+
+def _retry_after(headers):
+    try:
+        return min(float(headers.get('Retry-After')), BACKOFF_MAX)
+    except (TypeError, ValueError):
+        return None
+
+async def fetch_payload(session, limiter, year, province_code, table_name="s_epi_complete", cache=None,
+                        manifest=None, max_retries=MAX_RETRIES):
+    if manifest is not None and manifest.is_done(year, province_code):
+        # Finished by an earlier, interrupted attempt of this run
+        payload = cache.read_payload(table_name, year, province_code)
+        if payload is not None:
+            METRICS.increment('resumed_units', table=table_name)
+            return payload
+    if cache is not None:
+        payload = cache.get(table_name, year, province_code)
+        if payload is not None:
+            METRICS.increment('cache_hits', table=table_name)
+            if manifest is not None:
+                manifest.mark_done(year, province_code, len(payload))
+            return payload
+
+    data = {
+        "tableName": table_name,
+        "year": str(year),
+        "province": province_code,
+        "type": "json"
+    }
+    for attempt in range(max_retries + 1):
+        retry_after = None
+        async with limiter:
+            start = time.perf_counter()
+            try:
+                async with session.post(API_URL, headers=HEADERS, data=json.dumps(data)) as response:
+                    if response.status in [200, 201]:
+                        payload = await response.read()
+                        limiter.on_success()
+                        # Latency per (year, province) unit, including the body download
+                        METRICS.observe('request_seconds', time.perf_counter() - start, year=year, province=province_code)
+                        METRICS.observe('payload_bytes', len(payload), buckets=BYTES_BUCKETS, table=table_name)
+                        METRICS.increment('requests', status=response.status)
+                        if cache is not None:
+                            cache.put(table_name, year, province_code, payload)
+                        if manifest is not None:
+                            manifest.mark_done(year, province_code, len(payload))
+                        return payload
+                    METRICS.increment('requests', status=response.status)
+                    error = f"Status code: {response.status}"
+                    if response.status != 429 and response.status < 500:
+                        break  # other 4xx answers will not change on retry
+                    limiter.on_overload()
+                    retry_after = _retry_after(response.headers)
+            except asyncio.TimeoutError as e:
+                METRICS.increment('requests', status=type(e).__name__)
+                error = f"Error: {e!r}"
+                limiter.on_overload()
+            except aiohttp.ClientError as e:
+                METRICS.increment('requests', status=type(e).__name__)
+                error = f"Error: {e!r}"
+        if attempt < max_retries:
+            delay = backoff_delay(attempt, retry_after)
+            METRICS.increment('retries')
+            log(f"Retrying year {year}, province code {province_code} in {delay:.1f}s ({error})")
+            await asyncio.sleep(delay)
+
+    log(f"Failed to retrieve data for year {year}, province code {province_code}. {error}", level='warning')
+    if manifest is not None:
+        manifest.mark_failed(year, province_code, error)
+    return None
+
+def record_unit_rows(year, province_code, frame):
+    # Rows per (year, province) unit, as a gauge and in the rows-per-unit histogram
+    METRICS.set_gauge('unit_rows', len(frame), year=year, province=province_code)
+    METRICS.observe('unit_rows_distribution', len(frame), buckets=ROWS_BUCKETS)
+
+async def fetch_all_payloads(units, max_concurrency=DEFAULT_MAX_CONCURRENCY, table_name="s_epi_complete", cache=None,
+                             manifest=None):
+    # One session (and so one keep-alive connection pool) is shared by every request;
+    # the adaptive limiter keeps at most `max_concurrency` requests in flight, fewer
+    # while the API is pushing back.
+    limiter = AdaptiveLimiter(max_concurrency)
+    connector = aiohttp.TCPConnector(limit=max_concurrency, keepalive_timeout=60)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        tasks = [fetch_payload(session, limiter, year, province_code, table_name, cache, manifest)
+                 for year, province_code in units]
+        # gather keeps the results in the same order as `units`
+        return await asyncio.gather(*tasks)
+
+def open_manifest(manifest_name, table_name, units, cache):
+    # Checkpointed runs keep every payload in the response cache so a resume can reread them
+    if manifest_name is None:
+        return None, cache
+    cache = cache if cache is not None else ResponseCache()
+    return RunManifest(manifest_name, table_name, units), cache
+
+def close_manifest(manifest, payloads, units):
+    # Never hand back a partial dataset: missing units raise, and the manifest lets the
+    # next run fetch only those
+    missing = manifest.finish() if manifest is not None else \
+        [unit for unit, payload in zip(units, payloads) if payload is None]
+    if missing:
+        raise IncompleteFetchError(missing)
+
+def fetch_all_data(years=None, province_codes=None, max_concurrency=DEFAULT_MAX_CONCURRENCY, table_name="s_epi_complete",
+                   cache=None, manifest_name=None):
+    # Drop-in replacement for the ThreadPoolExecutor based fetch_all_data():
+    # by default fetches every closed fiscal year for every province.
+    # Pass a response_cache.ResponseCache to serve closed years from disk, and a
+    # manifest_name to checkpoint the run so a failed or killed run resumes where it stopped.
+    if years is None:
+        years = range(FIRST_YEAR_BE, get_current_year_be())
+    if province_codes is None:
+        province_codes = get_province_codes()
+
+    units = [(year, province_code) for year in years for province_code in province_codes]
+    manifest, cache = open_manifest(manifest_name, table_name, units, cache)
+    log(f"Fetching {len(units)} (year, province) units with up to {max_concurrency} concurrent requests...")
+    with METRICS.timer('fetch'):
+        payloads = asyncio.run(fetch_all_payloads(units, max_concurrency, table_name, cache, manifest))
+    if cache is not None:
+        log(f"Response cache: {cache.hits} hits, {cache.misses} misses.")
+    close_manifest(manifest, payloads, units)
+
+    # Concatenate once at the end instead of growing the frame on every completion,
+    # then dictionary-encode the codes across all provinces at once
+    with METRICS.timer('parse'):
+        frames = []
+        for (year, province_code), payload in zip(units, payloads):
+            if payload:
+                frames.append(decode_payload(payload))
+                record_unit_rows(year, province_code, frames[-1])
+        if not frames:
+            return pd.DataFrame()
+        return apply_raw_schema(pd.concat(frames, ignore_index=True))
@@ -0,0 +1,223 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+import async_fetch
+from columnar_output import save_parquet_dataset
+from fast_decode import decode_payload
+from metrics import log
+from mock_api import MockApi, payload_source, running_mock_api
+from parallel_reshape import reshape_parallel
+from quality_gate import QualityGate
+from reshape import ID_TO_NAME, MONTH_NUMBERS, fiscal_month_dates, map_column_to_date, reshape_wide_to_long
+from schema import apply_raw_schema
+from streaming_pipeline import CsvSink
+from synthetic_data import generate_raw, load_sample, raw_payloads
+from transform_data import transform_file, transform_file_parallel
+
+BASELINE_FILE = 'benchmark_baseline.json'
+DEFAULT_SCALES = [1, 10]
+REPEATS = 3
+# A case regresses when its time or peak memory exceeds the baseline by more than this
+DEFAULT_TOLERANCE = 0.25
+# Pure-Python reference paths are only run up to this scale; 100x would take minutes
+REFERENCE_MAX_SCALE = 10
+
+def legacy_transform(s_epi_complete_data_all):
+    # transform_data() as it was in optimization.ipynb, kept as the speed-up reference
+    df = s_epi_complete_data_all.copy()
+    df['report_name'] = df['id'].map(ID_TO_NAME)
+    df['b_year'] = df['b_year'].astype(int)
+    optimized_df_all = pd.DataFrame()
+    for month in range(1, 13):
+        target_col = f'target{str(month).zfill(2)}'
+        result_col = f'result{str(month).zfill(2)}'
+        date_col = df['b_year'].apply(lambda x: map_column_to_date(x, target_col))
+        temp_df = df[['report_name', 'hospcode', 'areacode', 'b_year']].copy()
+        temp_df['date'] = date_col
+        temp_df['target'] = df[target_col]
+        temp_df['result'] = df[result_col]
+        optimized_df_all = pd.concat([optimized_df_all, temp_df], ignore_index=True)
+    optimized_df_all.dropna(subset=['target', 'result'], inplace=True)
+    optimized_df_all['target'] = optimized_df_all['target'].astype(int)
+    optimized_df_all['result'] = optimized_df_all['result'].astype(int)
+    return optimized_df_all
+
+def scalar_dates(raw):
+    return [map_column_to_date(b_year, f'target{month:02d}')
+            for month in MONTH_NUMBERS for b_year in raw['b_year'].astype(int)]
+
+def vectorized_dates(raw):
+    b_year = raw['b_year'].to_numpy(dtype=np.int64)
+    return fiscal_month_dates(np.tile(b_year, 12), np.repeat(MONTH_NUMBERS, len(b_year)))
+
+def fetch_orchestration(payloads):
+    units = sorted(payloads)
+    with running_mock_api(MockApi(payload_source(payloads))) as url:
+        api_url, async_fetch.API_URL = async_fetch.API_URL, url
+        try:
+            return async_fetch.fetch_all_data(years=sorted({year for year, _ in units}),
+                                              province_codes=sorted({province for _, province in units}))
+        finally:
+            async_fetch.API_URL = api_url
+
+def build_cases(raw, workdir):
+    # name -> (function, max scale or None); every function takes no arguments
+    raw_typed = apply_raw_schema(raw.copy())
+    long_df = reshape_wide_to_long(raw_typed)
+    raw_csv = os.path.join(workdir, 'raw.csv')
+    raw.to_csv(raw_csv, index=False)
+    payloads = raw_payloads(raw)
+
+    def write_csv():
+        sink = CsvSink(os.path.join(workdir, 'long.csv'))
+        sink.write(long_df)
+        sink.close()
+
+    def write_parquet():
+        save_parquet_dataset(long_df, os.path.join(workdir, 'parquet'))
+
+    return {
+        'map_column_to_date': (lambda: scalar_dates(raw), REFERENCE_MAX_SCALE),
+        'fiscal_month_dates': (lambda: vectorized_dates(raw_typed), None),
+        'transform_legacy': (lambda: legacy_transform(raw), REFERENCE_MAX_SCALE),
+        'transform_data2': (lambda: reshape_wide_to_long(raw_typed), None),
+        'transform_parallel': (lambda: reshape_parallel(raw_typed, processes=None), None),
+        'transform_file_chunked': (lambda: transform_file(raw_csv, os.path.join(workdir, 'chunked.csv')), None),
+        'transform_file_parallel': (lambda: transform_file_parallel(raw_csv, os.path.join(workdir, 'parallel.csv')), None),
+        'quality_gate': (lambda: QualityGate().add(raw_typed), None),
+        'decode_payloads': (lambda: [decode_payload(payload) for payload in payloads.values()], None),
+        'write_csv': (write_csv, None),
+        'write_parquet': (write_parquet, None),
+        'fetch_orchestration': (lambda: fetch_orchestration(payloads), None)
+    }
+
+@contextmanager
+def quiet():
+    # The pipeline functions log progress; keep the benchmark output to the results
+    stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+def _rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+
+def peak_memory_mb(function):
+    # Peak RSS growth of one extra run in a forked child, so pyarrow and numpy buffers
+    # count too and the parent's heap is left as it was. tracemalloc is the fallback
+    # where fork or /proc is unavailable (it misses pyarrow and slows pure-Python code).
+    if hasattr(os, 'fork') and os.path.exists('/proc/self/statm'):
+        import resource
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            try:
+                start_mb = _rss_mb()
+                function()
+                peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 - start_mb
+                os.write(write_end, str(max(peak_mb, 0.0)).encode())
+            finally:
+                os._exit(0)
+        os.close(write_end)
+        with os.fdopen(read_end) as f:
+            output = f.read()
+        os.waitpid(pid, 0)
+        return float(output) if output else float('nan')
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 ** 2
+
+def measure(function, repeats=REPEATS):
+    timings = []
+    with quiet():
+        for _ in range(repeats):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        peak_mb = peak_memory_mb(function)
+    return min(timings), peak_mb
+
+def run_benchmarks(scales=DEFAULT_SCALES, cases=None, repeats=REPEATS):
+    results = {}
+    sample = load_sample()
+    for scale in scales:
+        raw = generate_raw(scale, sample)
+        workdir = tempfile.mkdtemp(prefix='benchmark_')
+        try:
+            for name, (function, max_scale) in build_cases(raw, workdir).items():
+                if (cases and name not in cases) or (max_scale is not None and scale > max_scale):
+                    continue
+                seconds, peak_mb = measure(function, repeats)
+                results[f'{name}@{scale}x'] = {'rows': len(raw), 'seconds': round(seconds, 4),
+                                               'rows_per_second': round(len(raw) / seconds),
+                                               'peak_mb': round(peak_mb, 1)}
+                log(f"{name + f'@{scale}x':<32} {seconds:>9.4f}s {len(raw) / seconds:>14,.0f} rows/s "
+                    f"{peak_mb:>9.1f} MB peak")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+def load_baseline(filename=BASELINE_FILE):
+    if not os.path.exists(filename):
+        return {}
+    with open(filename, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_baseline(results, filename=BASELINE_FILE):
+    baseline = load_baseline(filename)
+    baseline.update(results)
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(dict(sorted(baseline.items())), f, indent=2)
+        f.write('\n')
+    log(f"Baseline saved to {filename}: {len(baseline)} cases.")
+
+def find_regressions(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        for metric in ('seconds', 'peak_mb'):
+            limit = baseline[key][metric] * (1 + tolerance)
+            if result[metric] > limit:
+                regressions.append(f"{key} {metric}: {result[metric]} > {baseline[key][metric]} (+{tolerance:.0%})")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the s_epi_complete fetch and transform hot paths.')
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES, help='synthetic data scales, e.g. 1 10 100')
+    parser.add_argument('--cases', nargs='+', help='only run these cases')
+    parser.add_argument('--repeats', type=int, default=REPEATS)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--update-baseline', action='store_true', help='store these results as the new baseline')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.scales, args.cases, args.repeats)
+    if args.update_baseline:
+        save_baseline(results, args.baseline)
+        return 0
+    regressions = find_regressions(results, load_baseline(args.baseline), args.tolerance)
+    for regression in regressions:
+        log(f"REGRESSION {regression}")
+    if not regressions:
+        log("No regressions against the baseline.")
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
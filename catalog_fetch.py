@@ -0,0 +1,142 @@
+import argparse
+import asyncio
+from collections import defaultdict
+
+import aiohttp
+import pandas as pd
+
+from async_fetch import (DEFAULT_MAX_CONCURRENCY, REQUEST_TIMEOUT, AdaptiveLimiter, IncompleteFetchError,
+                         close_manifest, fetch_payload, open_manifest, record_unit_rows)
+from fast_decode import decode_payload
+from metrics import METRICS, log
+from quality_gate import PartitionLedger
+from response_cache import ResponseCache
+from schema import apply_schema
+from table_catalog import CATALOG, get_table
+
+def estimate_rows(jobs, cache):
+    # Expected rows per (table, year, partition) job from the response cache sidecars:
+    # 0 when get() will serve it from disk, the cached row count of an open year,
+    # else the mean over the partition's other years, else the table mean.
+    metas = {job: cache.read_meta(*job) if cache is not None else None for job in jobs}
+    by_partition, by_table = defaultdict(list), defaultdict(list)
+    for (table_name, _, partition), meta in metas.items():
+        if meta:
+            by_partition[(table_name, partition)].append(meta['row_count'])
+            by_table[table_name].append(meta['row_count'])
+
+    def mean(values):
+        return sum(values) / len(values) if values else 0
+
+    estimates = {}
+    for job, meta in metas.items():
+        table_name, year, partition = job
+        if meta and cache.serves(year, meta):
+            estimates[job] = 0
+        elif meta:
+            estimates[job] = meta['row_count']
+        else:
+            estimates[job] = mean(by_partition[(table_name, partition)]) or mean(by_table[table_name])
+    return estimates
+
+def schedule(jobs, cache):
+    # Largest partitions first, so the long downloads overlap the many short ones
+    # instead of trailing at the end of the run; ties keep the catalog order
+    estimates = estimate_rows(jobs, cache)
+    return sorted(jobs, key=lambda job: -estimates[job])
+
+async def fetch_jobs(jobs, max_concurrency=DEFAULT_MAX_CONCURRENCY, cache=None, manifests=None):
+    # Every table shares one session, one keep-alive pool and one adaptive limiter;
+    # the limiter hands out slots in FIFO order, so requests start in `jobs` order
+    manifests = manifests or {}
+    limiter = AdaptiveLimiter(max_concurrency)
+    connector = aiohttp.TCPConnector(limit=max_concurrency, keepalive_timeout=60)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        tasks = [fetch_payload(session, limiter, year, partition, table_name, cache, manifests.get(table_name))
+                 for table_name, year, partition in jobs]
+        return dict(zip(jobs, await asyncio.gather(*tasks)))
+
+def fetch_catalog(tables=None, years=None, partitions=None, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                  cache=None, manifest_name=None):
+    # Fetches every catalogued table (or just `tables`) in one run and returns
+    # {table name: DataFrame}. With a manifest_name each table gets its own checkpoint
+    # ({manifest_name}_{table}), so a rerun only fetches what is still missing.
+    specs = [get_table(name) for name in (tables or CATALOG)]
+    units = {spec.name: spec.units(years, partitions) for spec in specs}
+    manifests = {}
+    for spec in specs:
+        name = f'{manifest_name}_{spec.name}' if manifest_name else None
+        manifests[spec.name], cache = open_manifest(name, spec.name, units[spec.name], cache)
+
+    jobs = schedule([(spec.name, year, partition) for spec in specs for year, partition in units[spec.name]], cache)
+    log(f"Fetching {len(jobs)} units from {len(specs)} tables with up to {max_concurrency} concurrent requests, "
+        f"largest first...")
+    with METRICS.timer('fetch'):
+        payloads = asyncio.run(fetch_jobs(jobs, max_concurrency, cache, manifests))
+    if cache is not None:
+        log(f"Response cache: {cache.hits} hits, {cache.misses} misses.")
+
+    # Every table's manifest is closed before raising, so each one keeps its own progress
+    missing = []
+    for spec in specs:
+        table_payloads = [payloads[(spec.name, year, partition)] for year, partition in units[spec.name]]
+        try:
+            close_manifest(manifests[spec.name], table_payloads, units[spec.name])
+        except IncompleteFetchError as e:
+            missing += [(spec.name,) + tuple(unit) for unit in e.missing_units]
+    if missing:
+        raise IncompleteFetchError(missing)
+
+    # Frames are stitched in (year, partition) order whatever order they arrived in
+    results = {}
+    with METRICS.timer('parse'):
+        for spec in specs:
+            frames = []
+            for year, partition in units[spec.name]:
+                payload = payloads[(spec.name, year, partition)]
+                if payload:
+                    frames.append(decode_payload(payload))
+                    record_unit_rows(year, partition, frames[-1])
+            frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+            results[spec.name] = apply_schema(frame, spec.schema)
+            log(f"{spec.name}: {len(frame)} rows.")
+    return results
+
+def publish_tables(results, years=None, partitions=None):
+    # Every table's rows pass its quality check before any <table>_data_all.csv is written;
+    # the ledgers then record which (year, partition) units returned rows
+    checked = []
+    for table_name, frame in results.items():
+        spec = get_table(table_name)
+        table_years = spec.years(years)
+        table_partitions = spec.partitions(partitions)
+        ledger = PartitionLedger(spec.ledger_file)
+        with METRICS.timer('validate'):
+            gate = spec.check(frame, ledger.expected(table_years, table_partitions))
+        checked.append((table_name, frame, ledger, gate, table_years, table_partitions))
+
+    for table_name, frame, ledger, gate, table_years, table_partitions in checked:
+        filename = f'{table_name}_data_all.csv'
+        with METRICS.timer('save'):
+            frame.to_csv(filename, index=False)
+        ledger.record(gate.partitions, table_years, table_partitions)
+        log(f"Saved {len(frame)} {table_name} rows to {filename}.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fetch catalogued MOPH report_data tables in one run.')
+    parser.add_argument('--tables', nargs='+', choices=sorted(CATALOG), help='default: every catalogued table')
+    parser.add_argument('--years', type=int, nargs='+', help='BE fiscal years, default: every closed year')
+    parser.add_argument('--max-concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY)
+    parser.add_argument('--manifest', default='catalog', help='run manifest name prefix')
+    args = parser.parse_args(argv)
+
+    try:
+        results = fetch_catalog(args.tables, args.years, max_concurrency=args.max_concurrency,
+                                cache=ResponseCache(), manifest_name=args.manifest)
+        publish_tables(results, args.years)
+    finally:
+        METRICS.write_report()
+
+if __name__ == '__main__':
+    main()
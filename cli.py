@@ -0,0 +1,252 @@
+import argparse
+import os
+
+from drive_io import DRIVE_FOLDER_ID, NIGHTLY_UPLOADS, PUBLISHED_FILES, build_drive_service, upload_file
+from fiscal_units import FIRST_YEAR_BE, closed_years, get_current_year_be, get_province_codes, nightly_years
+from metrics import METRICS, log
+
+# One entry point for the pipeline stages:
+#   python cli.py fetch --years 2557-2566            raw rows of closed years -> s_epi_complete_data_all.csv
+#   python cli.py fetch-tables --years 2566          every catalogued table -> <table>_data_all.csv
+#   python cli.py transform                          raw CSV -> long CSV
+#   python cli.py upload daily all-years             published files -> Google Drive
+#   python cli.py run-all --provinces 50 --dry-run   the nightly upsert, here for one province
+# Only the standard library is imported up front; pandas, aiohttp, pyarrow and the Google
+# client load inside the subcommand that needs them, so --help, argument errors, dry runs
+# and uploads start in milliseconds.
+
+TABLE_NAME = 's_epi_complete'
+# Same partition layout as upsert.RawStore, read here without importing pandas
+STORE_DIR = 's_epi_complete_store'
+
+def parse_years(text):
+    # "2567", "2557-2566", "2560,2565-2567", or closed / current / all
+    current_year = get_current_year_be()
+    keywords = {'closed': (FIRST_YEAR_BE, current_year - 1), 'current': (current_year, current_year),
+                'all': (FIRST_YEAR_BE, current_year)}
+    years = set()
+    for part in text.split(','):
+        part = part.strip()
+        try:
+            if part in keywords:
+                first, last = keywords[part]
+            elif '-' in part:
+                first, last = (int(value) for value in part.split('-', 1))
+            else:
+                first = last = int(part)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid year range {part!r}; use e.g. 2567, 2557-2566 or closed")
+        if not FIRST_YEAR_BE <= first <= last <= current_year:
+            raise argparse.ArgumentTypeError(f"years must lie within {FIRST_YEAR_BE}-{current_year}, got {part!r}")
+        years.update(range(first, last + 1))
+    return sorted(years)
+
+def parse_provinces(text):
+    # "50", "10,50,90" or all; codes are the two-digit province prefixes of areacode
+    valid = get_province_codes()
+    if text.strip() == 'all':
+        return valid
+    codes = sorted(set(code.strip().zfill(2) for code in text.split(',') if code.strip()))
+    unknown = [code for code in codes if code not in valid]
+    if unknown or not codes:
+        raise argparse.ArgumentTypeError(f"unknown province code(s) {', '.join(unknown) or text!r}; "
+                                         f"valid codes are {valid[0]}-{valid[-1]} except the excluded ones")
+    return codes
+
+def format_years(years):
+    # [2557, 2558, 2559, 2562] -> "2557-2559, 2562"
+    spans = []
+    for year in years:
+        if spans and year == spans[-1][1] + 1:
+            spans[-1][1] = year
+        else:
+            spans.append([year, year])
+    return ', '.join(str(first) if first == last else f'{first}-{last}' for first, last in spans) or 'none'
+
+def stored_year(year, store_dir=STORE_DIR):
+    return os.path.exists(os.path.join(store_dir, 'raw', f'b_year={year}.parquet'))
+
+def print_plan(years, province_codes, manifest_name, revalidate=None):
+    # What a fetch would do, from the response cache sidecars and the run manifest alone:
+    # no request is sent and neither file is touched
+    from response_cache import ResponseCache
+    from run_manifest import resumable_units
+
+    cache = ResponseCache(revalidate=revalidate)
+    units = [(year, province_code) for year in years for province_code in province_codes]
+    resumed = resumable_units(manifest_name, TABLE_NAME, units)
+    cached = [unit for unit in units if cache.serves(unit[0], cache.read_meta(TABLE_NAME, *unit))]
+    skipped = set(cached) | set(unit for unit in units if (str(unit[0]), str(unit[1])) in resumed)
+    log(f"Years: {format_years(years)}")
+    everywhere = len(province_codes) == len(get_province_codes())
+    log(f"Provinces: {'all ' if everywhere else ''}{len(province_codes)}"
+        f"{'' if everywhere else ' (' + ', '.join(province_codes) + ')'}")
+    log(f"{len(units)} (year, province) units: {len(cached)} served from the response cache, "
+        f"{len(resumed)} already done in run manifest {manifest_name!r}, {len(units) - len(skipped)} to request.")
+
+def fetch(args):
+    years = args.years or closed_years()
+    province_codes = args.provinces or get_province_codes()
+    if args.dry_run:
+        print_plan(years, province_codes, args.manifest, args.revalidate)
+        log(f"Would write {args.output}.")
+        return
+
+    from async_fetch import DEFAULT_MAX_CONCURRENCY, fetch_all_data
+    from quality_gate import PartitionLedger, check_raw
+    from response_cache import ResponseCache
+
+    try:
+        data = fetch_all_data(years=years, province_codes=province_codes,
+                              max_concurrency=args.max_concurrency or DEFAULT_MAX_CONCURRENCY,
+                              cache=ResponseCache(revalidate=args.revalidate), manifest_name=args.manifest)
+        ledger = PartitionLedger()
+        gate = check_raw(data, ledger.expected(years, province_codes))
+        with METRICS.timer('save'):
+            data.to_csv(args.output, index=False)
+        ledger.record(gate.partitions, years, province_codes)
+        log(f"Saved {len(data)} raw rows to {args.output}.")
+    finally:
+        METRICS.write_report()
+
+def fetch_tables(args):
+    # Every catalogued report_data table (or --tables) in one run over a shared pool and
+    # response cache; each table is written only once its rows pass its quality check
+    from async_fetch import DEFAULT_MAX_CONCURRENCY
+    from catalog_fetch import fetch_catalog, publish_tables
+    from response_cache import ResponseCache
+
+    try:
+        results = fetch_catalog(args.tables, args.years, args.provinces,
+                                max_concurrency=args.max_concurrency or DEFAULT_MAX_CONCURRENCY,
+                                cache=ResponseCache(), manifest_name=args.manifest)
+        publish_tables(results, args.years, args.provinces)
+    finally:
+        METRICS.write_report()
+
+def transform(args):
+    # Chunked (flat memory) unless a process pool is asked for
+    processes = args.processes or os.cpu_count() or 1
+    chunked = args.processes == 1 or processes <= 1
+    if args.dry_run:
+        size = os.path.getsize(args.input) if os.path.exists(args.input) else None
+        log(f"Would transform {args.input} ({f'{size / 1e6:.1f} MB' if size is not None else 'missing'}) into "
+            f"{args.output}, {'in row chunks' if chunked else f'one fiscal year per process on {processes} processes'}.")
+        return
+
+    from transform_data import transform_file, transform_file_parallel
+
+    if chunked:
+        transform_file(args.input, args.output)
+    else:
+        transform_file_parallel(args.input, args.output, processes)
+    log(f"Transformed file saved to {args.output}.")
+
+def upload(args):
+    names = args.files or NIGHTLY_UPLOADS
+    # Checked here rather than with choices=, which rejects the empty default under nargs='*'
+    unknown = [name for name in names if name not in PUBLISHED_FILES]
+    if unknown:
+        args.parser.error(f"unknown file(s) {', '.join(unknown)}; choose from {', '.join(sorted(PUBLISHED_FILES))}")
+    if args.dry_run:
+        for name in names:
+            filename, file_id = PUBLISHED_FILES[name]
+            state = f'{os.path.getsize(filename) / 1e6:.1f} MB' if os.path.exists(filename) else 'missing'
+            log(f"Would upload {filename} ({state}) to folder {DRIVE_FOLDER_ID}"
+                f"{f' as file {file_id}' if file_id else ', matched by name'}.")
+        return
+
+    try:
+        service = build_drive_service()
+        for name in names:
+            filename, file_id = PUBLISHED_FILES[name]
+            with METRICS.timer('upload'):
+                upload_file(service, filename, DRIVE_FOLDER_ID, file_id)
+    finally:
+        METRICS.write_report()
+
+def run_all(args):
+    # The nightly job: fetch the open years (or --years), upsert them into the all-years
+    # store, publish the daily, all-years and rollup files, then upload them
+    years = args.years or nightly_years(stored_year)
+    province_codes = args.provinces or get_province_codes()
+    # Same check as fetch_data_and_save, before anything is planned or fetched
+    unseeded = [year for year in years if not stored_year(year)]
+    if args.provinces and unseeded:
+        raise SystemExit(f"run-all: fiscal years {format_years(unseeded)} are not in {STORE_DIR} yet; "
+                         f"run them without --provinces first")
+    if args.dry_run:
+        print_plan(years, province_codes, 's_epi_complete_daily')
+        if args.provinces:
+            log("Only these provinces' stored rows would be refreshed; every other province's rows are kept.")
+        if not args.no_upload:
+            # The daily file is only written (and uploaded) when the current year is fetched
+            files = [name for name in NIGHTLY_UPLOADS if name != 'daily' or get_current_year_be() in years]
+            upload(argparse.Namespace(files=files, dry_run=True))
+        return
+
+    from async_fetch import DEFAULT_MAX_CONCURRENCY
+    from optimized_fetch_data import fetch_data_and_save, upload_outputs
+
+    try:
+        published = fetch_data_and_save(years=years, province_codes=args.provinces,
+                                        max_concurrency=args.max_concurrency or DEFAULT_MAX_CONCURRENCY)
+        if not args.no_upload:
+            upload_outputs(published)
+    finally:
+        METRICS.write_report()
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='s_epi_complete pipeline: fetch, transform, upload, or all of it.')
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    subparsers.required = True
+
+    units = argparse.ArgumentParser(add_help=False)
+    units.add_argument('--years', type=parse_years, metavar='RANGE',
+                       help='BE fiscal years, e.g. 2567, 2557-2566, 2560,2565-2567, closed, current or all')
+    units.add_argument('--provinces', type=parse_provinces, metavar='CODES',
+                       help='two-digit province codes, e.g. 50 or 10,50,90 (default: all)')
+    units.add_argument('--max-concurrency', type=int, help='requests in flight at once')
+    dry_run = argparse.ArgumentParser(add_help=False)
+    dry_run.add_argument('--dry-run', action='store_true', help='print what would be done and exit')
+
+    fetch_parser = subparsers.add_parser('fetch', parents=[units, dry_run],
+                                         help='fetch raw rows (default: every closed year) to a CSV')
+    fetch_parser.add_argument('--output', default=PUBLISHED_FILES['raw'][0])
+    fetch_parser.add_argument('--manifest', default='s_epi_complete_yearly', help='run manifest name')
+    fetch_parser.add_argument('--revalidate', choices=['row_count', 'max_date_com'],
+                              help='recheck cached closed years against the API')
+    fetch_parser.set_defaults(handler=fetch)
+
+    tables_parser = subparsers.add_parser('fetch-tables', parents=[units],
+                                          help='fetch every catalogued report_data table to <table>_data_all.csv')
+    tables_parser.add_argument('--tables', nargs='+', metavar='TABLE', help='table names from table_catalog.CATALOG')
+    tables_parser.add_argument('--manifest', default='catalog', help='run manifest name prefix')
+    tables_parser.set_defaults(handler=fetch_tables)
+
+    transform_parser = subparsers.add_parser('transform', parents=[dry_run], help='reshape a raw CSV to long format')
+    transform_parser.add_argument('--input', default=PUBLISHED_FILES['raw'][0])
+    transform_parser.add_argument('--output', default=PUBLISHED_FILES['all-years'][0])
+    transform_parser.add_argument('--processes', type=int, default=1,
+                                  help='one fiscal year per process (0 = every core): faster, but holds the whole '
+                                       'file in memory; default 1 transforms in chunks with flat memory')
+    transform_parser.set_defaults(handler=transform)
+
+    upload_parser = subparsers.add_parser('upload', parents=[dry_run], help='upload published files to Google Drive')
+    upload_parser.add_argument('files', nargs='*', metavar='FILE',
+                               help=f"one or more of {', '.join(sorted(PUBLISHED_FILES))} "
+                                    f"(default: {' '.join(NIGHTLY_UPLOADS)})")
+    upload_parser.set_defaults(handler=upload, parser=upload_parser)
+
+    run_all_parser = subparsers.add_parser('run-all', parents=[units, dry_run],
+                                           help='nightly upsert of the open years, publish and upload')
+    run_all_parser.add_argument('--no-upload', action='store_true')
+    run_all_parser.set_defaults(handler=run_all)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.handler(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from metrics import log
+
+DEFAULT_PARQUET_DIR = 'optimized_s_epi_complete_data_all_parquet'
+PARTITION_COLUMNS = ['b_year', 'report_name']
+DICTIONARY_COLUMNS = ['hospcode', 'areacode']
+DEFAULT_COMPRESSION = 'zstd'
+# Partition for rows without a report (the odd null id the quality gate lets through)
+UNKNOWN_REPORT = '__unknown__'
+
+def dictionary_array(values):
+    # Fixed int32 index type so every chunk written to a partition has the same schema
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.cat.remove_unused_categories()
+        codes = values.cat.codes.to_numpy()
+        return pa.DictionaryArray.from_arrays(pa.array(codes, type=pa.int32(), mask=codes < 0),
+                                              pa.array(values.cat.categories.astype(str), type=pa.string()))
+    return pa.array(values, type=pa.string(), from_pandas=True).dictionary_encode()
+
+def frame_to_table(frame):
+    # Long-format frame (without the partition columns) -> Arrow table with
+    # dictionary-encoded codes and a date32 month column
+    columns = {}
+    for name in frame.columns:
+        if name in PARTITION_COLUMNS:
+            continue
+        if name in DICTIONARY_COLUMNS:
+            columns[name] = dictionary_array(frame[name])
+        elif name == 'date':
+            columns[name] = pa.array(pd.to_datetime(frame[name]).to_numpy(dtype='datetime64[D]'))
+        else:
+            columns[name] = pa.array(frame[name], from_pandas=True)
+    return pa.table(columns)
+
+def partition_path(root_dir, b_year, report_name):
+    return os.path.join(root_dir, f'b_year={b_year}', f'report_name={report_name}')
+
+class ParquetSink:
+    # Hive-partitioned Parquet dataset (b_year=/report_name=) written incrementally:
+    # one open writer per partition, each written chunk becomes a row group. Rows without a
+    # report go to report_name=__unknown__ rather than a null partition value, which makes
+    # unfiltered reads of the dataset fail to unify the report_name dictionary; the dataset
+    # then holds the same rows as the CSV.
+    def __init__(self, root_dir=DEFAULT_PARQUET_DIR, compression=DEFAULT_COMPRESSION):
+        self.root_dir = root_dir
+        self.compression = compression
+        self.rows_written = 0
+        self._writers = {}
+        if os.path.exists(root_dir):
+            shutil.rmtree(root_dir)
+        os.makedirs(root_dir)
+
+    def _writer(self, key, schema):
+        if key not in self._writers:
+            path = partition_path(self.root_dir, *key)
+            os.makedirs(path, exist_ok=True)
+            self._writers[key] = pq.ParquetWriter(os.path.join(path, 'part-0.parquet'), schema,
+                                                  compression=self.compression,
+                                                  use_dictionary=DICTIONARY_COLUMNS)
+        return self._writers[key]
+
+    def write(self, frame):
+        if frame.empty:
+            return
+        report_name = frame['report_name']
+        if report_name.isna().any():
+            if isinstance(report_name.dtype, pd.CategoricalDtype) and UNKNOWN_REPORT not in report_name.cat.categories:
+                report_name = report_name.cat.add_categories([UNKNOWN_REPORT])
+            frame = frame.assign(report_name=report_name.fillna(UNKNOWN_REPORT))
+        for key, partition in frame.groupby(PARTITION_COLUMNS, observed=True, sort=True):
+            table = frame_to_table(partition)
+            self._writer(key, table.schema).write_table(table)
+        self.rows_written += len(frame)
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+def save_parquet_dataset(optimized_df_all, root_dir=DEFAULT_PARQUET_DIR, compression=DEFAULT_COMPRESSION):
+    try:
+        log(f"Saving transformed data to Parquet dataset {root_dir}...")
+        sink = ParquetSink(root_dir, compression)
+        try:
+            sink.write(optimized_df_all)
+        finally:
+            sink.close()
+        log(f"Parquet dataset saved: {sink.rows_written} rows in {len(os.listdir(root_dir))} year partitions.")
+    except Exception as e:
+        log(f"Error saving Parquet dataset: {e}")
+        raise
+
+def read_parquet_dataset(root_dir=DEFAULT_PARQUET_DIR, columns=None, filters=None):
+    # e.g. filters=[('b_year', '>=', 2565), ('report_name', '=', '1yr')] only opens matching partitions
+    return pd.read_parquet(root_dir, engine='pyarrow', columns=columns, filters=filters)
@@ -0,0 +1,166 @@
+import gzip
+import hashlib
+import os
+import shutil
+
+from metrics import METRICS, log
+
+# Drive requires resumable chunks to be a multiple of 256 KiB
+CHUNK_UNIT = 256 * 1024
+DEFAULT_CHUNK_SIZE = 40 * CHUNK_UNIT  # 10 MiB
+NUM_RETRIES = 5
+
+DRIVE_FOLDER_ID = '1kUloOi3JWbV-ukH1OfpvN-S5lKt2_VND'
+# What the workflows publish to the shared folder: name -> (local file, Drive file id).
+# Uploads update the file id in place; a file without one is matched by name in the folder.
+PUBLISHED_FILES = {
+    'daily': ('optimized_s_epi_complete_data.csv', '1smFzFo3YSWQ_xtEMHr2ACxKc0KnYX0gA'),
+    'all-years': ('optimized_s_epi_complete_data_all.csv', '1Fh6eRGpc3vAWJjwPdk85RXuK6C6NRB1Y'),
+    'raw': ('s_epi_complete_data_all.csv', '1XTktfgbtlNN4CnsM4BnQ758uwG06uT7y'),
+    'rollup': ('s_epi_complete_rollup.csv', None),
+}
+NIGHTLY_UPLOADS = ['daily', 'all-years', 'rollup']
+
+# The Google client libraries are imported inside the functions that call Drive, so
+# importing this module (and every fetch or transform step that does) stays cheap
+
+def build_drive_service(service_account_file=None):
+    from google.oauth2 import service_account
+    from googleapiclient.discovery import build
+
+    service_account_file = service_account_file or os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
+    credentials = service_account.Credentials.from_service_account_file(service_account_file)
+    return build('drive', 'v3', credentials=credentials)
+
+def file_md5(path, block_size=1024 * 1024):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+def gzip_file(path):
+    # mtime=0 keeps the compressed bytes (and so their md5) stable across runs
+    gz_path = path + '.gz'
+    with open(path, 'rb') as src, open(gz_path, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as dst:
+        shutil.copyfileobj(src, dst, DEFAULT_CHUNK_SIZE)
+    return gz_path
+
+def get_remote_metadata(service, file_id):
+    # Returns None when the file does not exist (or is not visible to the service account)
+    from googleapiclient.errors import HttpError
+
+    try:
+        return service.files().get(fileId=file_id, fields='id,name,md5Checksum,size').execute(num_retries=NUM_RETRIES)
+    except HttpError as e:
+        if e.resp.status == 404:
+            return None
+        raise
+
+def _execute_resumable(request, filename):
+    # Sends the upload chunk by chunk; a dropped connection only repeats the current chunk
+    response = None
+    while response is None:
+        status, response = request.next_chunk(num_retries=NUM_RETRIES)
+        if status:
+            log(f"Uploading {filename}: {int(status.progress() * 100)}%")
+    return response
+
+def upload_file(service, filename, folder_id, file_id=None, mimetype='text/csv', chunk_size=DEFAULT_CHUNK_SIZE,
+                compress=False, skip_unchanged=True, remote_name=None):
+    if chunk_size % CHUNK_UNIT:
+        raise ValueError(f"chunk_size must be a multiple of {CHUNK_UNIT} bytes, got {chunk_size}")
+
+    upload_path = filename
+    if compress:
+        upload_path = gzip_file(filename)
+        mimetype = 'application/gzip'
+    remote_name = remote_name or os.path.basename(upload_path)
+
+    try:
+        if file_id:
+            remote = get_remote_metadata(service, file_id)
+            if remote is None:
+                log(f"File with ID {file_id} does not exist. Creating new file...")
+                file_id = None
+            elif skip_unchanged and remote.get('md5Checksum') == file_md5(upload_path):
+                log(f"{remote_name} unchanged in Google Drive (File ID: {file_id}), skipping upload.")
+                METRICS.increment('uploads', result='unchanged')
+                return file_id
+
+        if not file_id:
+            # Reuse a same-named file in the folder rather than piling up duplicates
+            remote = list_folder(service, folder_id).get(remote_name)
+            if remote:
+                file_id = remote['id']
+                if skip_unchanged and remote.get('md5Checksum') == file_md5(upload_path):
+                    log(f"{remote_name} unchanged in Google Drive (File ID: {file_id}), skipping upload.")
+                    METRICS.increment('uploads', result='unchanged')
+                    return file_id
+
+        from googleapiclient.http import MediaFileUpload
+
+        media = MediaFileUpload(upload_path, mimetype=mimetype, chunksize=chunk_size, resumable=True)
+        if file_id:
+            request = service.files().update(fileId=file_id, media_body=media, fields='id,md5Checksum')
+        else:
+            file_metadata = {'name': remote_name, 'parents': [folder_id]}
+            request = service.files().create(body=file_metadata, media_body=media, fields='id,md5Checksum')
+        response = _execute_resumable(request, remote_name)
+
+        if response.get('md5Checksum') and response['md5Checksum'] != file_md5(upload_path):
+            raise IOError(f"Checksum mismatch after uploading {remote_name} (File ID: {response.get('id')})")
+        log(f"Uploaded {remote_name} to Google Drive with File ID: {response.get('id')}")
+        METRICS.increment('uploads', result='uploaded')
+        METRICS.increment('upload_bytes', os.path.getsize(upload_path))
+        return response.get('id')
+    finally:
+        if compress and os.path.exists(upload_path):
+            os.remove(upload_path)
+
+def download_file(service, file_id, file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Streams the file to disk chunk by chunk, so it is never held in memory whole
+    from googleapiclient.http import MediaIoBaseDownload
+
+    request = service.files().get_media(fileId=file_id)
+    with open(file_path + '.part', 'wb') as fh:
+        downloader = MediaIoBaseDownload(fh, request, chunksize=chunk_size)
+        done = False
+        while not done:
+            status, done = downloader.next_chunk(num_retries=NUM_RETRIES)
+            if status:
+                log(f"Downloading {file_path}: {int(status.progress() * 100)}%")
+    os.replace(file_path + '.part', file_path)
+    return file_path
+
+def list_folder(service, folder_id):
+    # name -> metadata for every file directly inside the Drive folder
+    files, page_token = {}, None
+    while True:
+        response = service.files().list(q=f"'{folder_id}' in parents and trashed = false",
+                                        fields='nextPageToken, files(id,name,md5Checksum)',
+                                        pageToken=page_token).execute(num_retries=NUM_RETRIES)
+        for item in response.get('files', []):
+            files[item['name']] = item
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return files
+
+def upload_partitions(service, root_dir, folder_id, chunk_size=DEFAULT_CHUNK_SIZE, mimetype='application/octet-stream'):
+    # Delta upload of a partitioned dataset: every file under root_dir becomes one Drive
+    # file named after its relative path, and only files whose md5 differs are sent.
+    remote_files = list_folder(service, folder_id)
+    uploaded = skipped = 0
+    for dirpath, _, filenames in os.walk(root_dir):
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            remote_name = os.path.relpath(path, root_dir).replace(os.sep, '__')
+            remote = remote_files.get(remote_name)
+            if remote and remote.get('md5Checksum') == file_md5(path):
+                skipped += 1
+                continue
+            upload_file(service, path, folder_id, remote['id'] if remote else None, mimetype=mimetype,
+                        chunk_size=chunk_size, skip_unchanged=False, remote_name=remote_name)
+            uploaded += 1
+    log(f"Partition upload complete: {uploaded} uploaded, {skipped} unchanged.")
+    return uploaded, skipped
@@ -0,0 +1,61 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # fall back to the standard library parser
+    orjson = None
+
+from schema import COUNT_COLUMNS
+
+# Fixed schema of the s_epi_complete report_data payload; integer columns are
+# decoded straight into the compact widths declared in schema.RAW_SCHEMA
+STRING_COLUMNS = ['id', 'hospcode', 'areacode', 'date_com']
+INTEGER_DTYPES = dict({'b_year': np.int16}, **{column: np.int32 for column in COUNT_COLUMNS})
+SCHEMA_COLUMNS = STRING_COLUMNS + list(INTEGER_DTYPES)
+
+def loads(payload):
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+def _integer_buffer(values, dtype):
+    # Nullable integer column straight from the raw values (ints or numeric strings)
+    mask = np.fromiter((v is None or v == '' for v in values), dtype=bool, count=len(values))
+    filled = [0 if missing else v for v, missing in zip(values, mask)] if mask.any() else values
+    try:
+        data = np.array(filled, dtype=dtype)
+    except ValueError:
+        data = np.array(filled, dtype=np.float64).astype(dtype)
+    return pd.arrays.IntegerArray(data, mask)
+
+def _string_buffer(values):
+    # Codes like hospcode keep their leading zeros, so never go through a numeric type
+    return np.array([None if v is None else str(v) for v in values], dtype=object)
+
+def decode_rows(rows):
+    # List of row dicts -> dict of typed column buffers, in payload column order
+    if not rows:
+        return {}
+    keys = list(rows[0].keys())
+    columns = {}
+    for key in keys:
+        values = [row.get(key) for row in rows]
+        if key in INTEGER_DTYPES:
+            columns[key] = _integer_buffer(values, INTEGER_DTYPES[key])
+        else:
+            columns[key] = _string_buffer(values)
+    return columns
+
+def decode_payload(payload):
+    # Raw report_data response bytes -> typed DataFrame (replaces pd.json_normalize).
+    # orjson has no incremental API, so the whole list of row dicts is built first and
+    # lives alongside the column buffers until the frame is returned.
+    if not payload:
+        return pd.DataFrame()
+    rows = loads(payload)
+    if isinstance(rows, dict):
+        rows = [rows]
+    return pd.DataFrame(decode_rows(rows), copy=False)
@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from response_cache import is_closed_fiscal_year
+
+# A fetch unit is one (BE fiscal year, province code) request. These helpers only need the
+# standard library, so planning a run (the CLI's argument checks, a dry run) is instant.
+EXCLUDED_PROVINCES = ['10', '28', '29', '59', '68', '69', '78', '79', '87', '88', '89']
+FIRST_YEAR_BE = 2557
+
+def get_current_year_be():
+    return datetime.now().year + 543
+
+def get_province_codes():
+    return [f"{i:02d}" for i in range(11, 97) if f"{i:02d}" not in EXCLUDED_PROVINCES]
+
+def closed_years():
+    # Every fiscal year before the current one: the default range of the yearly fetch
+    return list(range(FIRST_YEAR_BE, get_current_year_be()))
+
+def nightly_years(has_year):
+    # Only the fiscal years whose rows can still change are fetched (the current year, and
+    # the previous one during its grace months); a year missing from the store is fetched once
+    return [year for year in range(FIRST_YEAR_BE, get_current_year_be() + 1)
+            if not has_year(year) or not is_closed_fiscal_year(year)]
@@ -0,0 +1,222 @@
+import gzip
+import json
+import os
+import struct
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from metrics import log
+
+# Health region, province and district boundaries from opendata-service.moph.go.th/gis/v1/geojson/{1,2,3}
+LAYERS = {'gdf1': 'gdf1.geojson', 'gdf2': 'gdf2.geojson', 'gdf3': 'gdf3.geojson'}
+DEFAULT_CACHE_DIR = 'geometry_cache'
+
+# Simplification tolerance per level, in degrees (0.01 deg ~ 1.1 km). The source
+# boundaries already have ~100 m vertex spacing, so useful levels start above that.
+TOLERANCES = {'full': 0.0, 'high': 0.005, 'medium': 0.02, 'low': 0.05}
+# Coordinates are snapped to a 1e-5 degree (~1 m) integer grid
+QUANTIZE_SCALE = 1e-5
+
+def _feature_polygons(geometry):
+    if geometry is None:  # a few features ship without geometry
+        return []
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    raise ValueError(f"Unsupported geometry type {geometry['type']}")
+
+def _quantize_ring(ring, translate):
+    points = np.rint((np.asarray(ring, dtype=np.float64)[:, :2] - translate) / QUANTIZE_SCALE).astype(np.int64)
+    # Drop the closing point and any vertices collapsed together by the snapping
+    if len(points) > 1 and (points[0] == points[-1]).all():
+        points = points[:-1]
+    keep = np.ones(len(points), dtype=bool)
+    keep[1:] = (np.diff(points, axis=0) != 0).any(axis=1)
+    return [tuple(p) for p in points[keep].tolist()]
+
+def load_layers(layers=LAYERS):
+    collections = {}
+    for name, path in layers.items():
+        with open(path, 'r', encoding='utf-8') as f:
+            collections[name] = json.load(f)['features']
+    return collections
+
+def build_topology(collections):
+    # Splits every ring at junctions (points where neighbouring polygons' boundaries meet
+    # or part) into arcs, storing each shared arc once. Simplifying arcs instead of
+    # rings is what keeps neighbouring polygons free of gaps and overlaps.
+    coordinates = np.concatenate([np.asarray(ring, dtype=np.float64)[:, :2]
+                                  for features in collections.values() for feature in features
+                                  for polygon in _feature_polygons(feature['geometry']) for ring in polygon])
+    translate = np.floor(coordinates.min(axis=0))
+
+    quantized = {name: [[[_quantize_ring(ring, translate) for ring in polygon]
+                         for polygon in _feature_polygons(feature['geometry'])] for feature in features]
+                 for name, features in collections.items()}
+
+    neighbours = {}
+    for features in quantized.values():
+        for polygons in features:
+            for polygon in polygons:
+                for ring in polygon:
+                    n = len(ring)
+                    for i, point in enumerate(ring):
+                        neighbours.setdefault(point, set()).update((ring[i - 1], ring[(i + 1) % n]))
+    junctions = {point for point, adjacent in neighbours.items() if len(adjacent) > 2}
+
+    arcs, arc_index = [], {}
+
+    def arc_ref(points):
+        key = tuple(points)
+        if key in arc_index:
+            return arc_index[key]
+        reverse = key[::-1]
+        if reverse in arc_index:
+            return ~arc_index[reverse]
+        arc_index[key] = len(arcs)
+        arcs.append(key)
+        return arc_index[key]
+
+    def ring_arcs(ring):
+        cuts = [i for i, point in enumerate(ring) if point in junctions]
+        if not cuts:
+            # Closed arc starting at its smallest point, so both sides of a shared ring match
+            start = ring.index(min(ring))
+            rotated = ring[start:] + ring[:start]
+            return [arc_ref(rotated + [rotated[0]])]
+        rotated = ring[cuts[0]:] + ring[:cuts[0]]
+        cuts = [i - cuts[0] for i in cuts] + [len(ring)]
+        closed = rotated + [rotated[0]]
+        return [arc_ref(closed[a:b + 1]) for a, b in zip(cuts[:-1], cuts[1:])]
+
+    objects = {}
+    for name, features in collections.items():
+        objects[name] = [{'properties': feature['properties'],
+                          'arcs': [[ring_arcs(ring) for ring in polygon if len(ring) >= 3] for polygon in polygons]}
+                         for feature, polygons in zip(features, quantized[name])]
+    log(f"Topology: {len(arcs)} arcs, {len(junctions)} junctions.")
+    return {'translate': translate, 'arcs': [np.asarray(arc, dtype=np.int64) for arc in arcs], 'objects': objects}
+
+def _douglas_peucker(points, tolerance, keep):
+    # Iterative Douglas-Peucker on one arc; entries already set in `keep` are always kept
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        segment = points[first + 1:last] - points[first]
+        direction = points[last] - points[first]
+        length = np.hypot(*direction)
+        if length == 0:
+            distances = np.hypot(segment[:, 0], segment[:, 1])
+        else:
+            distances = np.abs(segment[:, 0] * direction[1] - segment[:, 1] * direction[0]) / length
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            keep[first + 1 + index] = True
+        forced = np.flatnonzero(keep[first + 1:last])
+        if forced.size:
+            split = first + 1 + int(forced[np.argmin(np.abs(forced - index))])
+            stack.append((first, split))
+            stack.append((split, last))
+    return points[keep]
+
+def simplify_arc(arc, tolerance):
+    n = len(arc)
+    if tolerance <= 0 or n <= 3:
+        return arc
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+    if (arc[0] == arc[-1]).all():
+        # Closed single-arc ring: keep two interior anchors so it stays a polygon
+        keep[[n // 3, 2 * n // 3]] = True
+    return _douglas_peucker(arc, tolerance / QUANTIZE_SCALE, keep)
+
+def simplify_arcs(arcs, objects, tolerance):
+    simplified = [simplify_arc(arc, tolerance) for arc in arcs]
+    # A ring whose arcs all collapsed to straight segments would degenerate to a line;
+    # restore its arcs everywhere they are used so shared edges still match
+    for features in objects.values():
+        for feature in features:
+            for rings in feature['arcs']:
+                for refs in rings:
+                    if len(_ring_coordinates(simplified, refs)) < 4:
+                        for ref in refs:
+                            index = ref if ref >= 0 else ~ref
+                            simplified[index] = arcs[index]
+    return simplified
+
+def _ring_coordinates(arcs, refs):
+    parts = []
+    for i, ref in enumerate(refs):
+        points = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+        parts.append(points if i == 0 else points[1:])
+    return np.concatenate(parts)
+
+def to_wkb(arcs, polygons, translate):
+    # Little-endian WKB MultiPolygon
+    chunks = [struct.pack('<BII', 1, 6, len(polygons))]
+    for rings in polygons:
+        chunks.append(struct.pack('<BII', 1, 3, len(rings)))
+        for refs in rings:
+            coordinates = _ring_coordinates(arcs, refs) * QUANTIZE_SCALE + translate
+            chunks.append(struct.pack('<I', len(coordinates)))
+            chunks.append(np.ascontiguousarray(coordinates, dtype='<f8').tobytes())
+    return b''.join(chunks)
+
+def write_geoparquet(path, arcs, features, translate):
+    features = sorted(features, key=lambda feature: str(feature['properties'].get('id')))
+    columns = {key: pa.array([feature['properties'].get(key) for feature in features])
+               for key in features[0]['properties']}
+    columns['geometry'] = pa.array([to_wkb(arcs, feature['arcs'], translate) for feature in features], type=pa.binary())
+    geo = {'version': '1.0.0', 'primary_column': 'geometry',
+           'columns': {'geometry': {'encoding': 'WKB', 'geometry_types': ['MultiPolygon']}}}
+    table = pa.table(columns).replace_schema_metadata({b'geo': json.dumps(geo).encode('utf-8')})
+    pq.write_table(table, path, compression='zstd')
+
+def write_topojson(path, name, arcs, features, translate):
+    # Quantized, delta-encoded TopoJSON with one GeometryCollection object
+    encoded = [np.vstack([arc[:1], np.diff(arc, axis=0)]).tolist() for arc in arcs]
+    geometries = [{'type': 'MultiPolygon', 'id': feature['properties'].get('id'),
+                   'properties': feature['properties'], 'arcs': feature['arcs']} for feature in features]
+    topology = {'type': 'Topology',
+                'transform': {'scale': [QUANTIZE_SCALE, QUANTIZE_SCALE], 'translate': translate.tolist()},
+                'objects': {name: {'type': 'GeometryCollection', 'geometries': geometries}},
+                'arcs': encoded}
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump(topology, f, ensure_ascii=False, separators=(',', ':'))
+
+def build_geometry_cache(layers=LAYERS, cache_dir=DEFAULT_CACHE_DIR, tolerances=TOLERANCES):
+    # One topology per layer: neighbouring polygons of a layer share arcs, so every
+    # simplification level stays gap-free within that layer
+    try:
+        log("Building geometry cache...")
+        os.makedirs(cache_dir, exist_ok=True)
+        for name, features in load_layers(layers).items():
+            topology = build_topology({name: features})
+            for level, tolerance in tolerances.items():
+                arcs = simplify_arcs(topology['arcs'], topology['objects'], tolerance)
+                write_geoparquet(os.path.join(cache_dir, f'{name}_{level}.parquet'), arcs,
+                                 topology['objects'][name], topology['translate'])
+                write_topojson(os.path.join(cache_dir, f'{name}_{level}.topojson.gz'), name, arcs,
+                               topology['objects'][name], topology['translate'])
+                log(f"{name} {level}: {sum(len(arc) for arc in arcs)} vertices.")
+        log("Geometry cache build complete.")
+    except Exception as e:
+        log(f"Error building geometry cache: {e}")
+        raise
+
+def load_boundaries(layer='gdf3', level='medium', cache_dir=DEFAULT_CACHE_DIR, make_valid=True):
+    # GeoDataFrame keyed by `id`; geopandas is only needed by the reader.
+    # Coarse levels can leave a few self-touching rings, which make_valid repairs.
+    import geopandas as gpd
+    boundaries = gpd.read_parquet(os.path.join(cache_dir, f'{layer}_{level}.parquet')).set_index('id', drop=False)
+    if make_valid:
+        boundaries['geometry'] = boundaries.geometry.make_valid()
+    return boundaries
+
+if __name__ == '__main__':
+    build_geometry_cache()
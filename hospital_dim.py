@@ -0,0 +1,109 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from metrics import log
+from rollup import HEALTH_REGION_BY_PROVINCE
+
+# Facility code registry (hcode.moph.go.th) kept in the repository; selected_office.csv is
+# generated from it when the notebook's export from health_office.csv is not there
+REGISTRY_FILE = 'material/ตัวอย่างข้อมูลรหัสสถานพยาบาล.csv'
+OFFICE_FILE = 'material/selected_office.csv'
+HOSPCODE_LIST_FILE = 'material/hospcode_list.csv'
+DIMENSION_FILE = 'material/hospital_dim.csv'
+
+# hospcode is the 5-digit code5, so a dense array over 0..99999 indexes every possible code
+HOSPCODE_SPACE = 100000
+ATTRIBUTE_COLUMNS = ['name', 'prigov', 'type', 'org', 'region', 'provcode', 'prov', 'distcode', 'dist',
+                     'subdistcode', 'subdist']
+ENRICH_COLUMNS = ['region', 'provcode', 'distcode', 'type', 'org']
+CODE_DTYPES = {'hospcode': str, 'code9': str, 'code5': str, 'type': str, 'org': str, 'region': str,
+               'provcode': str, 'distcode': str, 'subdistcode': str}
+
+def build_office_table(registry_file=REGISTRY_FILE, office_file=OFFICE_FILE):
+    # The selected_office columns the dimension uses, from the registry: type is the hostype
+    # code, org the affiliation code (dep), region the health region of the province, and
+    # distcode / subdistcode the 4- and 6-digit codes that prefix areacode
+    try:
+        log(f"Building {office_file} from {registry_file}...")
+        registry = pd.read_csv(registry_file, dtype=str)
+        offices = pd.DataFrame({
+            'code9': registry['hoscodenew'], 'code5': registry['hoscode'], 'name': registry['hosname'],
+            'type': registry['hostype'], 'org': registry['dep'],
+            'region': registry['provcode'].map(HEALTH_REGION_BY_PROVINCE), 'provcode': registry['provcode'],
+            'distcode': registry['amcode'], 'subdistcode': registry['tmcode'],
+        })
+        offices.to_csv(office_file, index=False)
+        log(f"Office table saved to {office_file}: {len(offices)} offices.")
+        return offices
+    except Exception as e:
+        log(f"Error building office table: {e}")
+        raise
+
+def build_hospital_dimension(office_file=OFFICE_FILE, hospcode_list_file=HOSPCODE_LIST_FILE,
+                             dimension_file=DIMENSION_FILE):
+    # Same hospcode_list LEFT JOIN selected_office as s_epi_complete.ipynb, done once and
+    # saved with an integer surrogate key (hosp_key) so the pipeline never repeats it
+    try:
+        log("Building hospital dimension...")
+        if not os.path.exists(office_file):
+            build_office_table(office_file=office_file)
+        hospcodes = pd.read_csv(hospcode_list_file, dtype=CODE_DTYPES)
+        offices = pd.read_csv(office_file, dtype=CODE_DTYPES).drop_duplicates('code5')
+        dimension = hospcodes.merge(offices, left_on='hospcode', right_on='code5', how='left')
+        dimension = dimension.drop(columns=['code5']).drop_duplicates('hospcode').reset_index(drop=True)
+        dimension.insert(0, 'hosp_key', np.arange(len(dimension), dtype=np.int32))
+        dimension.to_csv(dimension_file, index=False)
+        log(f"Hospital dimension saved to {dimension_file}: {len(dimension)} hospitals.")
+        return HospitalDimension(dimension)
+    except Exception as e:
+        log(f"Error building hospital dimension: {e}")
+        raise
+
+def load_hospital_dimension(dimension_file=DIMENSION_FILE):
+    if not os.path.exists(dimension_file):
+        return build_hospital_dimension(dimension_file=dimension_file)
+    return HospitalDimension(pd.read_csv(dimension_file, dtype=CODE_DTYPES))
+
+def _hospcode_numbers(values):
+    # '07418' -> 7418; anything that is not a 5-digit code maps to -1
+    values = pd.Series(np.asarray(values, dtype=object))
+    valid = values.str.fullmatch(r'\d{5}').fillna(False).to_numpy(dtype=bool)
+    numbers = np.full(len(values), -1, dtype=np.int64)
+    numbers[valid] = values[valid].astype(np.int64).to_numpy()
+    return numbers
+
+class HospitalDimension:
+    def __init__(self, table):
+        self.table = table.sort_values('hosp_key').reset_index(drop=True)
+        # hospcode number -> hosp_key, -1 where the code is unknown
+        self.lookup = np.full(HOSPCODE_SPACE, -1, dtype=np.int32)
+        numbers = _hospcode_numbers(self.table['hospcode'])
+        self.lookup[numbers[numbers >= 0]] = self.table['hosp_key'].to_numpy(dtype=np.int32)[numbers >= 0]
+        # Attribute columns as categoricals, positionally aligned with hosp_key
+        self.attributes = {column: pd.Categorical(self.table[column])
+                           for column in ATTRIBUTE_COLUMNS if column in self.table.columns}
+
+    def keys_for(self, hospcodes):
+        # Vectorized hospcode -> hosp_key. For categoricals only the categories are parsed;
+        # the per-row work is two integer takes.
+        hospcodes = pd.Series(hospcodes)
+        if not isinstance(hospcodes.dtype, pd.CategoricalDtype):
+            hospcodes = hospcodes.astype('category')
+        numbers = _hospcode_numbers(hospcodes.cat.categories.astype(str))
+        category_keys = np.where(numbers >= 0, self.lookup[np.clip(numbers, 0, None)], -1).astype(np.int32)
+        codes = hospcodes.cat.codes.to_numpy()
+        return np.where(codes >= 0, category_keys[codes], -1).astype(np.int32)
+
+    def enrich(self, long_df, columns=ENRICH_COLUMNS):
+        # Adds hosp_key plus the requested attribute columns; unknown hospcodes get NaN
+        keys = self.keys_for(long_df['hospcode'])
+        enriched = long_df.copy(deep=False)
+        enriched['hosp_key'] = keys
+        for column in columns:
+            enriched[column] = self.attributes[column].take(keys, allow_fill=True)
+        missing = int((keys < 0).sum())
+        if missing:
+            log(f"Hospital dimension: {missing} rows with hospcode not in the dimension.")
+        return enriched
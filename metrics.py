@@ -0,0 +1,174 @@
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+DEFAULT_REPORT_FILE = 'run_report.json'
+# Set to a path (e.g. a node_exporter textfile collector file) to also write Prometheus text format
+PROMETHEUS_FILE_ENV = 'METRICS_PROMETHEUS_FILE'
+
+# Upper bounds of the histogram buckets, Prometheus style (+Inf is implicit)
+SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+ROWS_BUCKETS = (10, 100, 1e3, 1e4, 1e5, 1e6, 1e7)
+SLOWEST_UNITS = 10  # (year, province) units listed in the report's slowest table
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _label_text(key, extra=()):
+    pairs = list(key) + list(extra)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}' if pairs else ''
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # not available on Windows
+        return None
+    # ru_maxrss is in bytes on macOS and in KiB on Linux
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / 1024 ** 2 if sys.platform == 'darwin' else max_rss / 1024
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        # Bucket upper bound holding the q-th observation, like histogram_quantile() without interpolation
+        rank, seen = q * self.count, 0
+        for bound, count in zip(list(self.buckets) + [self.max], self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        def rounded(value):
+            return None if value is None else round(value, 6)
+
+        return {'count': self.count, 'sum': rounded(self.total), 'min': rounded(self.min), 'max': rounded(self.max),
+                'mean': rounded(self.total / self.count) if self.count else None,
+                'p50': rounded(self.quantile(0.5)), 'p95': rounded(self.quantile(0.95))}
+
+class Metrics:
+    # Counters, gauges and histograms keyed by (name, labels). Safe to update from the
+    # transform thread of the streaming pipeline as well as the event loop.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now()
+            self._start = time.perf_counter()
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+
+    def increment(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self.gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, buckets=SECONDS_BUCKETS, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        # Duration of one pipeline stage (fetch, parse, reshape, save, upload) into stage_seconds
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - start, stage=stage, **labels)
+
+    def report(self):
+        with self._lock:
+            stages = {dict(key)['stage']: histogram.summary() for (name, key), histogram in self.histograms.items()
+                      if name == 'stage_seconds' and len(key) == 1}
+            units = sorted(((dict(key), histogram) for (name, key), histogram in self.histograms.items()
+                            if name == 'request_seconds'), key=lambda item: -item[1].max)
+            return {
+                'started_at': self.started_at.isoformat(timespec='seconds'),
+                'duration_seconds': round(time.perf_counter() - self._start, 3),
+                'peak_rss_mb': peak_rss_mb(),
+                'stages': stages,
+                'slowest_units': [dict(labels, seconds=histogram.max) for labels, histogram in units[:SLOWEST_UNITS]],
+                'counters': [dict(key, name=name, value=value) for (name, key), value in sorted(self.counters.items())],
+                'gauges': [dict(key, name=name, value=value) for (name, key), value in sorted(self.gauges.items())],
+                'histograms': [dict(key, name=name, **histogram.summary())
+                               for (name, key), histogram in sorted(self.histograms.items(), key=lambda item: item[0])]
+            }
+
+    def prometheus_text(self, prefix='s_epi_'):
+        lines = []
+        with self._lock:
+            for kind, series, suffix in (('counter', self.counters, '_total'), ('gauge', self.gauges, '')):
+                for name in sorted({name for name, _ in series}):
+                    lines.append(f'# TYPE {prefix}{name}{suffix} {kind}')
+                    lines += [f'{prefix}{name}{suffix}{_label_text(key)} {value}'
+                              for (series_name, key), value in sorted(series.items()) if series_name == name]
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f'# TYPE {prefix}{name} histogram')
+                for (series_name, key), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if series_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append(f'{prefix}{name}_bucket{_label_text(key, [("le", bound)])} {cumulative}')
+                    lines.append(f'{prefix}{name}_sum{_label_text(key)} {histogram.total}')
+                    lines.append(f'{prefix}{name}_count{_label_text(key)} {histogram.count}')
+        lines.append(f'# TYPE {prefix}run_duration_seconds gauge')
+        lines.append(f'{prefix}run_duration_seconds {time.perf_counter() - self._start}')
+        rss = peak_rss_mb()
+        if rss is not None:
+            lines.append(f'# TYPE {prefix}peak_rss_bytes gauge')
+            lines.append(f'{prefix}peak_rss_bytes {int(rss * 1024 ** 2)}')
+        return '\n'.join(lines) + '\n'
+
+    def write_report(self, filename=DEFAULT_REPORT_FILE, prometheus_file=None):
+        prometheus_file = prometheus_file or os.environ.get(PROMETHEUS_FILE_ENV)
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2, default=str)
+        if prometheus_file:
+            # Written then renamed so a collector never scrapes a half-written file
+            with open(prometheus_file + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(self.prometheus_text())
+            os.replace(prometheus_file + '.tmp', prometheus_file)
+        log(f"Run report saved to {filename}" + (f" and {prometheus_file}." if prometheus_file else "."))
+
+# Process-wide registry shared by every pipeline module
+METRICS = Metrics()
+
+def log(message, **fields):
+    # Timestamped progress line; keyword fields are appended as key=value and counted
+    # per level so the run report shows how many warnings/errors were printed
+    level = fields.pop('level', 'info')
+    METRICS.increment('log_messages', level=level)
+    suffix = ' '.join(f'{key}={value}' for key, value in fields.items())
+    print(f"{datetime.now().strftime('%H:%M:%S')} {message}" + (f" {suffix}" if suffix else ''))
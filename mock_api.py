@@ -0,0 +1,160 @@
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from aiohttp import web
+
+from metrics import log
+from response_cache import DEFAULT_CACHE_DIR, ResponseCache
+
+# Local stand-in for opendata.moph.go.th/api/report_data. Point the fetch code at it with
+#   MOPH_API_URL=http://127.0.0.1:8099/api/report_data python optimized_fetch_data.py
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8099
+API_PATH = '/api/report_data'
+REQUIRED_FIELDS = ('tableName', 'year', 'province', 'type')
+SEND_CHUNK = 64 * 1024  # bytes per body write, the granularity of the throughput cap
+
+def cache_source(cache_dir=DEFAULT_CACHE_DIR):
+    # Replays payloads recorded by response_cache.ResponseCache during real runs
+    cache = ResponseCache(cache_dir)
+    return lambda table_name, year, province_code: cache.read_payload(table_name, year, province_code)
+
+def payload_source(payloads, table_name='s_epi_complete'):
+    # Serves in-memory payloads keyed by (year, province), e.g. synthetic_data.raw_payloads()
+    return lambda table, year, province_code: payloads.get((year, province_code)) if table == table_name else None
+
+class ThroughputLimiter:
+    # Caps the bytes sent per second across all responses
+    def __init__(self, bytes_per_second):
+        self.bytes_per_second = bytes_per_second
+        self._lock = asyncio.Lock()
+        self._next_send = 0.0
+
+    async def consume(self, n_bytes):
+        if not self.bytes_per_second:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_send)
+            self._next_send = start + n_bytes / self.bytes_per_second
+        if start > now:
+            await asyncio.sleep(start - now)
+
+class MockApi:
+    def __init__(self, source, latency=0.0, latency_jitter=0.0, bytes_per_second=None, error_rate=0.0,
+                 throttle_rate=0.0, truncate_rate=0.0, retry_after=1, seed=None):
+        self.source = source
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.limiter = ThroughputLimiter(bytes_per_second)
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.truncate_rate = truncate_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.stats = {'requests': 0, 'ok': 0, 'errors': 0, 'throttled': 0, 'truncated': 0, 'bad_requests': 0}
+
+    async def handle(self, request):
+        self.stats['requests'] += 1
+        try:
+            body = await request.json()
+            missing = [field for field in REQUIRED_FIELDS if field not in body]
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            body, missing = None, list(REQUIRED_FIELDS)
+        if missing:
+            self.stats['bad_requests'] += 1
+            return web.json_response({'error': f"missing fields {missing}"}, status=400)
+
+        delay = self.latency + self.random.uniform(-self.latency_jitter, self.latency_jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        # Faults are drawn per request in a fixed order so a seed reproduces a run
+        roll = self.random.random()
+        if roll < self.error_rate:
+            self.stats['errors'] += 1
+            return web.Response(status=self.random.choice([500, 502, 503]))
+        if roll < self.error_rate + self.throttle_rate:
+            self.stats['throttled'] += 1
+            return web.Response(status=429, headers={'Retry-After': str(self.retry_after)})
+
+        payload = self.source(body['tableName'], str(body['year']), str(body['province']))
+        payload = b'[]' if payload is None else payload
+        truncate = self.random.random() < self.truncate_rate
+
+        response = web.StreamResponse(status=200, headers={'Content-Type': 'application/json'})
+        response.content_length = len(payload)
+        await response.prepare(request)
+        end = len(payload) // 2 if truncate else len(payload)
+        for start in range(0, end, SEND_CHUNK):
+            chunk = payload[start:min(start + SEND_CHUNK, end)]
+            await self.limiter.consume(len(chunk))
+            await response.write(chunk)
+        if truncate:
+            # Drop the connection mid-body: the client sees fewer bytes than Content-Length
+            self.stats['truncated'] += 1
+            request.transport.close()
+            return response
+        self.stats['ok'] += 1
+        await response.write_eof()
+        return response
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post(API_PATH, self.handle)
+        return app
+
+@contextmanager
+def running_mock_api(mock, host=DEFAULT_HOST, port=0):
+    # Serves `mock` on its own thread and event loop, so callers can keep using
+    # asyncio.run(); yields the report_data URL (port 0 picks a free port)
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(mock.app(), access_log=None)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, host, port)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://{host}:{port}{API_PATH}'
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.run_until_complete(runner.cleanup())
+        loop.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Local stand-in for the MOPH report_data API.')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--source', choices=['cache', 'synthetic'], default='cache',
+                        help='replay the response cache, or serve synthetic_data payloads')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--scale', type=float, default=1, help='synthetic data scale')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--latency-jitter', type=float, default=0.0)
+    parser.add_argument('--bytes-per-second', type=float, help='total throughput cap')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered 5xx')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='share of requests answered 429')
+    parser.add_argument('--truncate-rate', type=float, default=0.0, help='share of bodies cut off halfway')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    if args.source == 'synthetic':
+        from synthetic_data import generate_raw, raw_payloads
+        source = payload_source(raw_payloads(generate_raw(args.scale)))
+    else:
+        source = cache_source(args.cache_dir)
+    mock = MockApi(source, args.latency, args.latency_jitter, args.bytes_per_second, args.error_rate,
+                   args.throttle_rate, args.truncate_rate, seed=args.seed)
+    log(f"Mock report_data API on http://{args.host}:{args.port}{API_PATH} ({args.source} payloads)")
+    web.run_app(mock.app(), host=args.host, port=args.port, print=None)
+
+if __name__ == '__main__':
+    main()
@@ -1,140 +1,164 @@
-import requests
-import pandas as pd
-import json
-from datetime import datetime
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+import argparse
 import os
-
-def log(message):
-    print(message)
-
-def map_column_to_date(b_year, column):
-    try:
-        ce_year = b_year - 543
-        month_num = int(column[-2:])
-        year = ce_year - 1 if month_num >= 10 else ce_year
-        return f"{year}-{str(month_num).zfill(2)}-01"
-    except Exception as e:
-        log(f"Error in map_column_to_date: {e}")
-        raise
-
-def fetch_data_for_province(year, province_code):
-    url = "https://opendata.moph.go.th/api/report_data"
-    headers = {"Content-Type": "application/json"}
-    data = {
-        "tableName": "s_epi_complete",
-        "year": str(year),
-        "province": province_code,
-        "type": "json"
-    }
-    response = requests.post(url, headers=headers, data=json.dumps(data))
-    if response.status_code in [200, 201]:
-        temp_df = pd.json_normalize(response.json())
-        return temp_df
-    else:
-        log(f"Failed to retrieve data for year {year}, province code {province_code}. Status code: {response.status_code}")
-        return pd.DataFrame()  # Return an empty DataFrame in case of failure
-    
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-def fetch_all_data():
-    current_year_be = datetime.now().year + 543
-    excluded_provinces = ['10', '28', '29', '59', '68', '69', '78', '79', '87', '88', '89']
-    province_codes = [f"{i:02d}" for i in range(11, 97) if f"{i:02d}" not in excluded_provinces]
+import shutil
+import sys
+from functools import partial
+
+import async_fetch
+from async_fetch import DEFAULT_MAX_CONCURRENCY, get_current_year_be, get_province_codes
+from response_cache import ResponseCache
+from parallel_reshape import reshape_parallel
+from schema import memory_report
+from streaming_pipeline import CsvSink, TeeSink, run_streaming_pipeline
+from columnar_output import DEFAULT_PARQUET_DIR, ParquetSink, save_parquet_dataset
+from hospital_dim import load_hospital_dimension
+from rollup import DEFAULT_ROLLUP_FILE, RollupSink
+from drive_io import DEFAULT_CHUNK_SIZE, DRIVE_FOLDER_ID, build_drive_service, upload_file, upload_partitions
+from metrics import METRICS, log
+from quality_gate import PartitionLedger, QualityGate
+
+def fetch_all_data(max_concurrency=DEFAULT_MAX_CONCURRENCY, revalidate=None):
+    current_year_be = get_current_year_be()
+    province_codes = get_province_codes()
     # years = range(2557, 2558) # This comment is for testing
     years = range(2557, current_year_be)
 
-    all_data = pd.DataFrame()
-    
-    # Parallel Data Fetching
-    with ThreadPoolExecutor(max_workers=20) as executor:
-        # Create a list to hold futures
-        futures = []
-        for year in years:
-            for province_code in province_codes:
-                futures.append(executor.submit(fetch_data_for_province, year, province_code))
-
-        # As each future completes, concatenate its result
-        for future in as_completed(futures):
-            all_data = pd.concat([all_data, future.result()], ignore_index=True)
-
-    return all_data
+    # Parallel Data Fetching over a shared keep-alive connection pool;
+    # closed fiscal years come from the on-disk cache unless revalidating
+    cache = ResponseCache(revalidate=revalidate)
+    return async_fetch.fetch_all_data(years, province_codes, max_concurrency=max_concurrency, cache=cache,
+                                      manifest_name='s_epi_complete_yearly')
 
-def transform_data2(s_epi_complete_data_all):
+def transform_data2(s_epi_complete_data_all, report_memory=False, hospital_dim=None, processes=1):
     try:
         log("Starting data transformation...")
-        id_to_name = {
-            "28dd2c7955ce926456240b2ff0100bde": "1yr",
-            "35f4a8d465e6e1edc05f3d8ab658c551": "2yr",
-            "d1fe173d08e959397adf34b1d77e88d7": "3yr",
-            "f033ab37c30201f73f142449d037028d": "5yr",
-            "30f72fc853a2cc02ef953dc97f36f596": "7yr"
-        }
-
-        # Vectorized operation
-        s_epi_complete_data_all['report_name'] = pd.Categorical(s_epi_complete_data_all['id'].map(id_to_name))
-
-        s_epi_complete_data_all['b_year'] = s_epi_complete_data_all['b_year'].astype(int)
-
-        optimized_df_all = pd.DataFrame()
-
-        for month in range(1, 13):
-            target_col = f'target{str(month).zfill(2)}'
-            result_col = f'result{str(month).zfill(2)}'
-            date_col = s_epi_complete_data_all['b_year'].apply(lambda x: map_column_to_date(x, target_col))
-            temp_df = s_epi_complete_data_all[['report_name', 'hospcode', 'areacode', 'b_year']].copy()
-            temp_df['date'] = date_col
-            temp_df['target'] = s_epi_complete_data_all[target_col]
-            temp_df['result'] = s_epi_complete_data_all[result_col]
-            optimized_df_all = pd.concat([optimized_df_all, temp_df], ignore_index=True)
-
-        optimized_df_all.dropna(subset=['target', 'result'], inplace=True)
-        optimized_df_all['target'] = optimized_df_all['target'].astype(int)
-        optimized_df_all['result'] = optimized_df_all['result'].astype(int)
+        # Single vectorized wide-to-long reshape (report names, fiscal dates, null drop);
+        # with processes > 1 (None = every core) each fiscal year is reshaped in its own process
+        with METRICS.timer('reshape'):
+            optimized_df_all = reshape_parallel(s_epi_complete_data_all, processes)
+        METRICS.increment('rows_reshaped', len(optimized_df_all))
+        if hospital_dim is not None:
+            # Attach hosp_key and region/province/type columns with one array take
+            optimized_df_all = hospital_dim.enrich(optimized_df_all)
+        if report_memory:
+            memory_report(s_epi_complete_data_all, "raw")
+            memory_report(optimized_df_all, "long")
 
         log("Data transformation completed successfully.")
         return optimized_df_all  # Ensure the return statement is within the try block.
     except Exception as e:
-        log(f"Error during data transformation: {e}")
+        log(f"Error during data transformation: {e}", level='error')
         raise
 
-def save_transformed_data(optimized_df_all, filename='optimized_s_epi_complete_data_all.csv'):
+def save_transformed_data(optimized_df_all, filename='optimized_s_epi_complete_data_all.csv', parquet_dir=None):
     try:
         log("Saving transformed data to CSV...")
-        optimized_df_all.to_csv(filename, index=False)
+        with METRICS.timer('save'):
+            optimized_df_all.to_csv(filename, index=False)
+            # Optional columnar copy partitioned by b_year/report_name for Tableau and notebooks
+            if parquet_dir:
+                save_parquet_dataset(optimized_df_all, parquet_dir)
         log("Optimized yearly data transformation and saving complete.")
     except Exception as e:
-        log(f"Error saving transformed data: {e}")
+        log(f"Error saving transformed data: {e}", level='error')
         raise
 
-def upload_to_drive(filename, folder_id, file_id=None):
+def upload_to_drive(filename, folder_id, file_id=None, chunk_size=DEFAULT_CHUNK_SIZE, compress=False):
     try:
         log("Starting upload to Google Drive...")
-        service_account_file = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-        credentials = service_account.Credentials.from_service_account_file(service_account_file)
-        service = build('drive', 'v3', credentials=credentials)
-        media = MediaFileUpload(filename, mimetype='text/csv')
+        service = build_drive_service()
+        # Resumable chunked upload; skipped entirely when Drive already holds identical bytes (md5Checksum)
+        with METRICS.timer('upload'):
+            upload_file(service, filename, folder_id, file_id, chunk_size=chunk_size, compress=compress)
+    except Exception as e:
+        log(f"Error during upload to Google Drive: {e}", level='error')
+        raise
 
-        if file_id:
-            updated_file = service.files().update(fileId=file_id, media_body=media, fields='id').execute()
-            log(f"Updated {filename} in Google Drive with File ID: {updated_file.get('id')}")
-        else:
-            file_metadata = {'name': os.path.basename(filename), 'parents': [folder_id]}
-            file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-            log(f"Uploaded {filename} to Google Drive with File ID: {file.get('id')}")
+def upload_parquet_to_drive(parquet_dir, folder_id, chunk_size=DEFAULT_CHUNK_SIZE):
+    try:
+        log("Starting delta upload of Parquet partitions to Google Drive...")
+        # Only partitions whose content hash changed since the last run are re-sent
+        with METRICS.timer('upload'):
+            upload_partitions(build_drive_service(), parquet_dir, folder_id, chunk_size=chunk_size)
+    except Exception as e:
+        log(f"Error during Parquet upload to Google Drive: {e}", level='error')
+        raise
 
+def stage(path, copy=False):
+    # Sinks write to path + '.tmp'; copy=True starts it from the published file (the rollup
+    # cube is merged into, not rewritten)
+    staged = path + '.tmp'
+    discard(staged)
+    if copy and os.path.exists(path):
+        shutil.copyfile(path, staged)
+    return staged
+
+def promote(staged, path):
+    if os.path.isdir(staged) and os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(staged, path)
+
+def discard(staged):
+    if os.path.isdir(staged):
+        shutil.rmtree(staged)
+    elif os.path.exists(staged):
+        os.remove(staged)
+
+def fetch_transform_and_save(filename='optimized_s_epi_complete_data_all.csv', parquet_dir=DEFAULT_PARQUET_DIR,
+                             max_concurrency=DEFAULT_MAX_CONCURRENCY, enrich=False):
+    # Streaming variant of fetch_all_data() + transform_data2() + save_transformed_data():
+    # each province payload is reshaped as soon as it arrives and appended to the CSV,
+    # folded into the rollup cube and written to the partitioned Parquet dataset
+    # (unless parquet_dir is None). All three are staged next to their published paths and
+    # only replace them once the quality gate has passed.
+    staged = {}
+    try:
+        years = range(2557, get_current_year_be())
+        province_codes = get_province_codes()
+        staged[filename] = stage(filename)
+        staged[DEFAULT_ROLLUP_FILE] = stage(DEFAULT_ROLLUP_FILE, copy=True)
+        sinks = [CsvSink(staged[filename]), RollupSink(staged[DEFAULT_ROLLUP_FILE])]
+        if parquet_dir:
+            staged[parquet_dir] = stage(parquet_dir)
+            sinks.append(ParquetSink(staged[parquet_dir]))
+        sink = TeeSink(*sinks)
+        transform = transform_data2
+        if enrich:
+            transform = partial(transform_data2, hospital_dim=load_hospital_dimension())
+        # Every raw chunk passes through the quality gate on its way to the transform; a
+        # failed check raises once the run is complete, before anything is published
+        ledger = PartitionLedger()
+        gate = QualityGate(ledger.expected(years, province_codes))
+        run_streaming_pipeline(gate.checked(transform), sink, years=years, province_codes=province_codes,
+                               max_concurrency=max_concurrency, cache=ResponseCache(),
+                               manifest_name='s_epi_complete_yearly_stream')
+        gate.enforce()
+        for path, staged_path in staged.items():
+            promote(staged_path, path)
+        ledger.record(gate.partitions, years, province_codes)
+        log("Optimized yearly data transformation and saving complete.")
     except Exception as e:
-        log(f"Error during upload to Google Drive: {e}")
+        log(f"Error in streaming fetch and transform: {e}", level='error')
         raise
+    finally:
+        # Anything still staged here means the run or the gate failed: the published files are untouched
+        for path in staged.values():
+            discard(path)
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Streaming yearly fetch: raw rows -> long CSV, rollup cube and Parquet.')
+    parser.add_argument('--enrich', action='store_true',
+                        help='attach hosp_key and region/province/district/type/org columns from the hospital dimension')
+    args = parser.parse_args()
     try:
-        s_epi_complete_data_all = fetch_all_data()
-        optimized_df_all = transform_data2(s_epi_complete_data_all)
-        save_transformed_data(optimized_df_all)  # Call the new function to save the data
+        fetch_transform_and_save(enrich=args.enrich)
         # Specify the folder ID and file ID for Google Drive upload
-        upload_to_drive('optimized_s_epi_complete_data_all.csv', '1kUloOi3JWbV-ukH1OfpvN-S5lKt2_VND', '1Fh6eRGpc3vAWJjwPdk85RXuK6C6NRB1Y')
+        upload_to_drive('optimized_s_epi_complete_data_all.csv', DRIVE_FOLDER_ID, '1Fh6eRGpc3vAWJjwPdk85RXuK6C6NRB1Y')
+        # The Parquet partitions go to the same folder, named b_year=...__report_name=...__part-0.parquet
+        upload_parquet_to_drive(DEFAULT_PARQUET_DIR, DRIVE_FOLDER_ID)
     except Exception as e:
-        log(f"Unexpected error in main: {e}")
+        log(f"Unexpected error in main: {e}", level='error')
+        sys.exit(1)
+    finally:
+        # Per-stage timings, per-(year, province) latencies and peak RSS for this run
+        METRICS.write_report()
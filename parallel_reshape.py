@@ -0,0 +1,181 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from metrics import log
+from reshape import ID_TO_NAME, LONG_COLUMNS, RESULT_COLUMNS, TARGET_COLUMNS, reshape_wide_to_long
+
+# Fiscal years are independent, so the raw rows are reshaped one partition per task:
+# by b_year, or by (b_year, id) to get more, smaller tasks when there are few years
+PARTITION_KEYS = {
+    'year': ['b_year'],
+    'year_report': ['b_year', 'id']
+}
+# Below this many raw rows the pool start-up costs more than it saves
+MIN_PARALLEL_ROWS = 50000
+# Categorical columns cross the process boundary as integer codes; the categories are
+# sent once per worker (pool initializer) instead of once per partition
+CODE_COLUMNS = ['report_name', 'hospcode', 'areacode']
+
+# Set in each pool worker by _init_worker()
+_categories = {}
+
+def _write_stream(sink, table):
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.tell()
+
+def _to_shared(table):
+    # Arrow table -> IPC stream in a new shared memory block; returns the block name and size.
+    # The stream is sized with a mock write first, then written straight into the block.
+    size = _write_stream(pa.MockOutputStream(), table)
+    block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        buffer = pa.py_buffer(block.buf)
+        _write_stream(pa.FixedSizeBufferWriter(buffer), table)
+        del buffer
+        return block.name, size
+    finally:
+        block.close()
+
+def _bytes_to_shared(data):
+    block = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+    try:
+        block.buf[:len(data)] = data
+        return block.name, len(data)
+    finally:
+        block.close()
+
+def _from_shared(name, size):
+    # One memcpy out of the block, so the frame (which to_pandas() may build as zero-copy
+    # views on the Arrow buffers) never points into memory that is about to be unmapped
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        stream = pa.py_buffer(bytes(block.buf[:size]))
+        return pa.ipc.open_stream(stream).read_all().to_pandas()
+    finally:
+        block.close()
+
+def _unlink(name):
+    try:
+        block = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+def _init_worker(categories):
+    _categories.update(categories)
+
+def _reshape_shared(name, size):
+    raw = _from_shared(name, size)
+    for column in CODE_COLUMNS:
+        raw[column] = pd.Categorical.from_codes(raw[column].to_numpy(), categories=_categories[column])
+    return reshape_wide_to_long(raw)
+
+def _reshape_partition(name, size):
+    # Pool task: raw partition in, long partition (codes again) out, both as shared Arrow buffers
+    long_df = _reshape_shared(name, size)
+    for column in CODE_COLUMNS:
+        long_df[column] = long_df[column].cat.codes
+    return _to_shared(pa.Table.from_pandas(long_df, preserve_index=False))
+
+def _csv_partition(name, size):
+    # Pool task: raw partition in, CSV rows (no header) out as shared bytes
+    long_df = _reshape_shared(name, size)
+    return _bytes_to_shared(long_df.to_csv(index=False, header=False).encode('utf-8')) + (len(long_df),)
+
+def partition_positions(df, partition_by):
+    # Row positions of each partition in key order; rows with a null id form their own
+    # partition (last) instead of being dropped the way groupby drops null keys
+    group_ids = df.groupby(PARTITION_KEYS[partition_by], sort=True, observed=True, dropna=False).ngroup().to_numpy()
+    order = np.argsort(group_ids, kind='stable')
+    return np.split(order, np.flatnonzero(np.diff(group_ids[order])) + 1)
+
+def _share_partitions(df, partition_by):
+    # Raw frame -> one shared Arrow block per partition, plus the categories of the code columns
+    if partition_by not in PARTITION_KEYS:
+        raise ValueError(f"partition_by must be one of {sorted(PARTITION_KEYS)}, got {partition_by!r}")
+    report_name = df['report_name'] if 'report_name' in df.columns else df['id'].map(ID_TO_NAME)
+    categoricals = {'report_name': pd.Categorical(report_name), 'hospcode': pd.Categorical(df['hospcode']),
+                    'areacode': pd.Categorical(df['areacode'])}
+    raw = pd.DataFrame(dict({column: categoricals[column].codes for column in CODE_COLUMNS},
+                            **{column: df[column] for column in ['b_year'] + TARGET_COLUMNS + RESULT_COLUMNS}))
+    table = pa.Table.from_pandas(raw, preserve_index=False)
+    blocks = []
+    try:
+        for positions in partition_positions(df, partition_by):
+            blocks.append(_to_shared(table.take(pa.array(positions))))
+    except BaseException:
+        for name, _ in blocks:
+            _unlink(name)
+        raise
+    return blocks, {column: categoricals[column].categories for column in CODE_COLUMNS}
+
+def _map_partitions(task, blocks, categories, processes):
+    # Runs task(name, size) for every shared partition; results come back in partition
+    # order whatever order the workers finish in. The input blocks are always released.
+    futures = []
+    try:
+        with ProcessPoolExecutor(max_workers=min(processes, len(blocks)), initializer=_init_worker,
+                                 initargs=(categories,)) as executor:
+            futures = [executor.submit(task, name, size) for name, size in blocks]
+        return [future.result() for future in futures]
+    except BaseException:
+        for future in futures:
+            if not future.cancelled() and future.exception() is None:
+                _unlink(future.result()[0])
+        raise
+    finally:
+        for name, _ in blocks:
+            _unlink(name)
+
+def reshape_parallel(df, processes=None, partition_by='year', min_rows=MIN_PARALLEL_ROWS):
+    # reshape_wide_to_long() over a process pool. Partitions travel to and from the workers
+    # as Arrow IPC buffers in shared memory, so no DataFrame is pickled. Rows come out
+    # ordered by partition key, month-major within each partition.
+    processes = processes or os.cpu_count() or 1
+    if processes <= 1 or len(df) < min_rows:
+        return reshape_wide_to_long(df)
+    blocks, categories = _share_partitions(df, partition_by)
+    log(f"Reshaping {len(df)} rows in {len(blocks)} {partition_by} partitions on {processes} processes...")
+    outputs = _map_partitions(_reshape_partition, blocks, categories, processes)
+    try:
+        long_df = pd.concat([_from_shared(name, size) for name, size in outputs], ignore_index=True)
+    finally:
+        for name, _ in outputs:
+            _unlink(name)
+    for column in CODE_COLUMNS:
+        long_df[column] = pd.Categorical.from_codes(long_df[column].to_numpy(), categories=categories[column])
+    return long_df[LONG_COLUMNS]
+
+def write_csv_parallel(df, output_path, processes=None, partition_by='year', min_rows=MIN_PARALLEL_ROWS):
+    # Raw frame -> long CSV. CSV encoding costs far more than the reshape itself, so each
+    # worker reshapes and encodes its own partition; the parts are appended in partition
+    # order under one header. Returns the number of rows written.
+    processes = processes or os.cpu_count() or 1
+    if processes <= 1 or len(df) < min_rows:
+        long_df = reshape_wide_to_long(df)
+        long_df.to_csv(output_path, index=False)
+        return len(long_df)
+    blocks, categories = _share_partitions(df, partition_by)
+    log(f"Reshaping and writing {len(df)} rows in {len(blocks)} {partition_by} partitions on {processes} processes...")
+    outputs = _map_partitions(_csv_partition, blocks, categories, processes)
+    try:
+        with open(output_path, 'wb') as f:
+            f.write(pd.DataFrame(columns=LONG_COLUMNS).to_csv(index=False).encode('utf-8'))
+            for name, size, _ in outputs:
+                block = shared_memory.SharedMemory(name=name)
+                try:
+                    with block.buf[:size] as view:
+                        f.write(view)
+                finally:
+                    block.close()
+    finally:
+        for name, _, _ in outputs:
+            _unlink(name)
+    return sum(rows for _, _, rows in outputs)
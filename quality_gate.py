@@ -0,0 +1,211 @@
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from fiscal_units import get_province_codes
+from metrics import METRICS, log
+from reshape import ID_TO_NAME
+from schema import MONTHS
+from upsert import UPSERT_KEY, key_hash
+
+DEFAULT_LEDGER_FILE = 'quality_partitions.json'
+# areacode is the 8-digit village code; its first two digits are the province, the first four the district
+AREACODE_PATTERN = r'\d{8}'
+# District codes the areacode prefix is checked against: the MOPH district boundary layer,
+# plus the facility registry's amcode for districts newer than the layer. Both ship with the
+# code, so they are found next to this module whatever the working directory.
+MATERIAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'material')
+DISTRICT_FILE = os.path.join(MATERIAL_DIR, 'gdf3.csv')
+REGISTRY_FILE = os.path.join(MATERIAL_DIR, 'ตัวอย่างข้อมูลรหัสสถานพยาบาล.csv')
+COUNT_PAIRS = [('target', 'result')] + [(f'target{month}', f'result{month}') for month in MONTHS]
+CHECKS = ['duplicate_key', 'result_over_target', 'negative_count', 'unknown_report', 'missing_report_id',
+          'malformed_areacode', 'unknown_province', 'unknown_district', 'missing_partition']
+# Share of rows (of expected partitions, for missing_partition) a check may flag before the
+# publish is blocked. The API returns the odd row without a report id, which reshape keeps
+# with an empty report_name, so that one check gets some slack.
+DEFAULT_TOLERANCE = dict({check: 0.0 for check in CHECKS}, missing_report_id=0.01)
+SAMPLE_ROWS = 3  # example keys kept per failing check
+
+class QualityError(RuntimeError):
+    # Raised instead of publishing; report is QualityGate.report()
+    def __init__(self, report):
+        self.report = report
+        failed = [f"{check} ({result['rows']})" for check, result in report['checks'].items() if result['failed']]
+        super().__init__(f"Quality gate failed on {report['rows']} rows: {', '.join(failed)}")
+
+@lru_cache(maxsize=None)
+def get_district_codes(district_file=DISTRICT_FILE, registry_file=REGISTRY_FILE):
+    codes = pd.read_csv(district_file, usecols=['id'], dtype=str)['id']
+    codes = pd.concat([codes, pd.read_csv(registry_file, usecols=['amcode'], dtype=str)['amcode']])
+    return frozenset(codes.dropna())
+
+class SeenKeys:
+    # Key hashes of every row added so far, as sorted runs whose sizes roughly double from the
+    # newest to the oldest (merged like a binary counter), so a lookup costs a few binary
+    # searches and all the merging together stays O(n log n)
+    def __init__(self):
+        self.runs = []
+
+    def add(self, hashes):
+        # True for hashes seen in an earlier call or earlier in this array
+        seen = pd.Series(hashes).duplicated().to_numpy(copy=True)
+        for run in self.runs:
+            positions = np.minimum(np.searchsorted(run, hashes), len(run) - 1)
+            seen |= run[positions] == hashes
+        self.runs.append(np.unique(hashes))
+        while len(self.runs) > 1 and len(self.runs[-2]) <= 2 * len(self.runs[-1]):
+            self.runs[-2:] = [np.union1d(self.runs[-2], self.runs[-1])]
+        return seen
+
+def _codes(values):
+    # (row codes, distinct values as strings); null rows get code -1
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), pd.Index(values.cat.categories).astype(str)
+    codes, uniques = pd.factorize(values)
+    return codes, pd.Index(uniques).astype(str)
+
+def _flag_rows(values, flag_values, null_flag):
+    # flag_values() runs on the distinct values only (a few thousand areacodes, a handful
+    # of report ids) and the flags are mapped back to the rows by code; code -1 (null)
+    # picks the appended null_flag
+    codes, uniques = _codes(values)
+    return np.append(np.asarray(flag_values(uniques), dtype=bool), null_flag)[codes]
+
+def _partition_keys(raw):
+    # b_year * 100 + province number per row; -1 where the areacode has no numeric prefix
+    codes, uniques = _codes(raw['areacode'])
+    prefixes = np.asarray(pd.to_numeric(uniques.str[:2], errors='coerce'), dtype=np.float64)
+    province = np.append(np.nan_to_num(prefixes, nan=-1), -1).astype(np.int64)[codes]
+    return np.where(province >= 0, raw['b_year'].to_numpy(dtype=np.int64) * 100 + province, -1)
+
+class QualityGate:
+    # Validates raw s_epi_complete rows before anything is published. Each check is one
+    # vectorized pass over a column (or over its distinct values for the code columns),
+    # so frames can be added whole or unit by unit as the streaming pipeline parses them.
+    # enforce() logs a compact report and raises QualityError when a check fails.
+    def __init__(self, expected_partitions=(), tolerance=None):
+        self.expected_partitions = set(expected_partitions)
+        self.tolerance = dict(DEFAULT_TOLERANCE, **(tolerance or {}))
+        self.rows = 0
+        self.partitions = set()
+        self.counts = {check: 0 for check in CHECKS}
+        self.samples = {check: [] for check in CHECKS}
+        self._provinces = get_province_codes()
+        self._districts = get_district_codes()
+        self._seen_keys = SeenKeys()
+
+    def _record(self, check, mask, raw):
+        count = int(mask.sum())
+        self.counts[check] += count
+        missing = SAMPLE_ROWS - len(self.samples[check])
+        if count and missing > 0:
+            rows = raw.iloc[np.flatnonzero(mask)[:missing]][UPSERT_KEY]
+            self.samples[check] += rows.astype(str).to_dict('records')
+
+    def add(self, raw):
+        if raw is None or raw.empty:
+            return
+        self.rows += len(raw)
+
+        # Against every row added so far, not just this chunk: the streaming pipeline adds one unit at a time
+        self._record('duplicate_key', self._seen_keys.add(key_hash(raw)), raw)
+
+        over = np.zeros(len(raw), dtype=bool)
+        negative = np.zeros(len(raw), dtype=bool)
+        for target_column, result_column in COUNT_PAIRS:
+            # Nulls become NaN, which compares False either way
+            target = raw[target_column].to_numpy(dtype=np.float64, na_value=np.nan)
+            result = raw[result_column].to_numpy(dtype=np.float64, na_value=np.nan)
+            over |= result > target
+            negative |= (target < 0) | (result < 0)
+        self._record('result_over_target', over, raw)
+        self._record('negative_count', negative, raw)
+
+        report_ids = list(ID_TO_NAME)
+        self._record('unknown_report', _flag_rows(raw['id'], lambda ids: ~ids.isin(report_ids), False), raw)
+        self._record('missing_report_id', raw['id'].isna().to_numpy(), raw)
+
+        well_formed = _flag_rows(raw['areacode'], lambda codes: codes.str.fullmatch(AREACODE_PATTERN), False)
+        self._record('malformed_areacode', ~well_formed, raw)
+        known_province = _flag_rows(raw['areacode'], lambda codes: codes.str[:2].isin(self._provinces), False)
+        self._record('unknown_province', well_formed & ~known_province, raw)
+        known_district = _flag_rows(raw['areacode'], lambda codes: codes.str[:4].isin(self._districts), False)
+        self._record('unknown_district', well_formed & known_province & ~known_district, raw)
+
+        keys = np.unique(_partition_keys(raw))
+        self.partitions |= set((int(key) // 100, f'{key % 100:02d}') for key in keys[keys >= 0])
+
+    def checked(self, transform):
+        # Wraps a streaming-pipeline transform so every raw chunk is validated on its way through
+        def validate_and_transform(raw):
+            self.add(raw)
+            return transform(raw)
+        return validate_and_transform
+
+    def report(self):
+        checks = {}
+        for check in CHECKS[:-1]:
+            share = self.counts[check] / self.rows if self.rows else 0.0
+            checks[check] = {'rows': self.counts[check], 'share': share, 'samples': self.samples[check],
+                             'failed': share > self.tolerance[check]}
+        # A (year, province) that had rows last run and has none now: a failed or empty fetch
+        missing = sorted(self.expected_partitions - self.partitions)
+        share = len(missing) / len(self.expected_partitions) if self.expected_partitions else 0.0
+        checks['missing_partition'] = {'rows': len(missing), 'share': share,
+                                       'samples': [f'{year}/{province}' for year, province in missing[:SAMPLE_ROWS]],
+                                       'failed': share > self.tolerance['missing_partition']}
+        return {'rows': self.rows, 'partitions': len(self.partitions), 'checks': checks,
+                'passed': not any(result['failed'] for result in checks.values())}
+
+    def enforce(self):
+        report = self.report()
+        log(f"Quality gate: {report['rows']} rows in {report['partitions']} (year, province) partitions, "
+            f"{'passed' if report['passed'] else 'FAILED'}.", level='info' if report['passed'] else 'error')
+        for check, result in report['checks'].items():
+            METRICS.increment('quality_violations', result['rows'], check=check)
+            if result['rows']:
+                log(f"  {check}: {result['rows']} ({result['share']:.3%}){' over tolerance' if result['failed'] else ''}, "
+                    f"e.g. {result['samples']}", level='error' if result['failed'] else 'warning')
+        if not report['passed']:
+            raise QualityError(report)
+        return report
+
+def check_raw(raw, expected_partitions=(), tolerance=None):
+    # One-shot gate over a whole raw frame; returns the gate (its .partitions feed the ledger)
+    gate = QualityGate(expected_partitions, tolerance)
+    with METRICS.timer('validate'):
+        gate.add(raw)
+    gate.enforce()
+    return gate
+
+class PartitionLedger:
+    # The (year, province) partitions that returned rows in the last published run,
+    # {"2567": ["11", "12", ...]}; a partition missing from the next run fails the gate
+    def __init__(self, path=DEFAULT_LEDGER_FILE):
+        self.path = path
+        self.years = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.years = json.load(f)
+
+    def expected(self, years, province_codes):
+        province_codes = set(province_codes)
+        return set((int(year), province) for year in years for province in self.years.get(str(year), [])
+                   if province in province_codes)
+
+    def record(self, partitions, years, province_codes):
+        # Replaces what this run covered (its years x provinces); other provinces are kept
+        province_codes = set(province_codes)
+        for year in years:
+            kept = set(self.years.get(str(year), [])) - province_codes
+            fetched = set(province for partition_year, province in partitions if partition_year == int(year))
+            self.years[str(year)] = sorted(kept | (fetched & province_codes))
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(dict(sorted(self.years.items())), f)
+        os.replace(self.path + '.tmp', self.path)
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+ID_TO_NAME = {
+    "28dd2c7955ce926456240b2ff0100bde": "1yr",
+    "35f4a8d465e6e1edc05f3d8ab658c551": "2yr",
+    "d1fe173d08e959397adf34b1d77e88d7": "3yr",
+    "f033ab37c30201f73f142449d037028d": "5yr",
+    "30f72fc853a2cc02ef953dc97f36f596": "7yr"
+}
+
+MONTH_NUMBERS = np.arange(1, 13)
+TARGET_COLUMNS = [f'target{str(month).zfill(2)}' for month in MONTH_NUMBERS]
+RESULT_COLUMNS = [f'result{str(month).zfill(2)}' for month in MONTH_NUMBERS]
+KEY_COLUMNS = ['report_name', 'hospcode', 'areacode', 'b_year']
+LONG_COLUMNS = KEY_COLUMNS + ['date', 'target', 'result']
+
+def map_column_to_date(b_year, column):
+    # Scalar reference for a single cell; reshape_wide_to_long() does the same for whole columns
+    ce_year = b_year - 543  # Convert the Buddhist Era (BE) year to Common Era (CE) by subtracting 543
+    month_num = int(column[-2:])  # Extract the month number from the column name
+    year = ce_year - 1 if month_num >= 10 else ce_year  # Oct-Dec belong to the previous CE year
+    return f"{year}-{str(month_num).zfill(2)}-01"
+
+def fiscal_month_dates(b_year, month):
+    # Vectorized map_column_to_date: arrays of BE fiscal years and month numbers -> datetime64[ns]
+    ce_year = np.asarray(b_year, dtype=np.int64) - 543 - (np.asarray(month) >= 10)
+    months_since_epoch = (ce_year - 1970) * 12 + (np.asarray(month, dtype=np.int64) - 1)
+    return months_since_epoch.astype('datetime64[M]').astype('datetime64[ns]')
+
+def reshape_wide_to_long(df):
+    # Raw s_epi_complete rows (one per hospcode/report/year with 12 monthly column pairs)
+    # -> long format with one row per month, in month-major order like the old concat loop.
+    n = len(df)
+    if 'report_name' not in df.columns:
+        report_name = pd.Categorical(df['id'].map(ID_TO_NAME))
+    else:
+        report_name = pd.Categorical(df['report_name'])
+    b_year = df['b_year'].to_numpy(dtype=np.int16)
+    # Codes are carried as categoricals so the 12x expansion only copies integer codes
+    hospcode = pd.Categorical(df['hospcode'])
+    areacode = pd.Categorical(df['areacode'])
+
+    # (n, 12) blocks flattened column-major, i.e. all of month 1 first, then month 2, ...
+    targets = df[TARGET_COLUMNS].to_numpy(dtype=np.float64, na_value=np.nan).ravel(order='F')
+    results = df[RESULT_COLUMNS].to_numpy(dtype=np.float64, na_value=np.nan).ravel(order='F')
+    months = np.repeat(MONTH_NUMBERS, n)
+
+    # Drop months without data in the same pass
+    keep = ~(np.isnan(targets) | np.isnan(results))
+    row_index = np.tile(np.arange(n), 12)[keep]
+
+    # dtypes follow schema.LONG_SCHEMA
+    return pd.DataFrame({
+        'report_name': report_name.take(row_index),
+        'hospcode': hospcode.take(row_index),
+        'areacode': areacode.take(row_index),
+        'b_year': b_year[row_index],
+        'date': fiscal_month_dates(b_year[row_index], months[keep]),
+        'target': targets[keep].astype(np.int32),
+        'result': results[keep].astype(np.int32)
+    }, columns=LONG_COLUMNS)
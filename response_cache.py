@@ -0,0 +1,96 @@
+import gzip
+import json
+import os
+from datetime import datetime
+
+from metrics import log
+
+DEFAULT_CACHE_DIR = 'response_cache'
+
+# A fiscal year (Oct-Sep) counts as closed this many months after it ends,
+# giving late HDC submissions time to land before the payload is frozen.
+CLOSE_GRACE_MONTHS = 3
+
+REVALIDATE_MODES = (None, 'row_count', 'max_date_com')
+
+def is_closed_fiscal_year(b_year, now=None, grace_months=CLOSE_GRACE_MONTHS):
+    now = now or datetime.now()
+    # Fiscal year `b_year` (BE) ends in September of CE year b_year - 543
+    months_since_end = (now.year - (int(b_year) - 543)) * 12 + now.month - 9
+    return months_since_end > grace_months
+
+def payload_stats(payload):
+    rows = json.loads(payload) if payload else []
+    date_coms = [str(row.get('date_com')) for row in rows if row.get('date_com') is not None]
+    return {
+        'row_count': len(rows),
+        'max_date_com': max(date_coms) if date_coms else None
+    }
+
+class ResponseCache:
+    # On-disk cache of raw report_data payloads, one gzip file per
+    # (tableName, year, province) with a small JSON sidecar holding its stats.
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, revalidate=None, now=None):
+        if revalidate not in REVALIDATE_MODES:
+            raise ValueError(f"revalidate must be one of {REVALIDATE_MODES}, got {revalidate!r}")
+        self.cache_dir = cache_dir
+        self.revalidate = revalidate
+        self.now = now
+        self.hits = 0
+        self.misses = 0
+
+    def _base_path(self, table_name, year, province_code):
+        return os.path.join(self.cache_dir, table_name, str(year), province_code)
+
+    def is_closed(self, year):
+        return is_closed_fiscal_year(year, self.now)
+
+    def read_meta(self, table_name, year, province_code):
+        meta_path = self._base_path(table_name, year, province_code) + '.meta.json'
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def read_payload(self, table_name, year, province_code):
+        payload_path = self._base_path(table_name, year, province_code) + '.json.gz'
+        if not os.path.exists(payload_path):
+            return None
+        with gzip.open(payload_path, 'rb') as f:
+            return f.read()
+
+    def serves(self, year, meta):
+        # Whether get() answers from disk for an entry with this sidecar
+        return not self.revalidate and self.is_closed(year) and bool(meta and meta.get('closed'))
+
+    def get(self, table_name, year, province_code):
+        # Only closed years are served from disk; open years (and every year in
+        # revalidation mode) must go back to the API.
+        if self.revalidate or not self.is_closed(year):
+            return None
+        meta = self.read_meta(table_name, year, province_code)
+        payload = self.read_payload(table_name, year, province_code) if self.serves(year, meta) else None
+        if payload is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return payload
+
+    def put(self, table_name, year, province_code, payload):
+        stats = payload_stats(payload)
+        previous = self.read_meta(table_name, year, province_code)
+        if self.revalidate and previous and previous.get(self.revalidate) != stats[self.revalidate]:
+            log(f"Cached {table_name} year {year}, province code {province_code} changed: "
+                f"{self.revalidate} {previous.get(self.revalidate)} -> {stats[self.revalidate]}")
+
+        base_path = self._base_path(table_name, year, province_code)
+        os.makedirs(os.path.dirname(base_path), exist_ok=True)
+        meta = dict(stats, closed=self.is_closed(year), fetched_at=datetime.now().isoformat(timespec='seconds'))
+
+        # Write to a temp file and rename so an interrupted run never leaves a torn entry
+        with gzip.open(base_path + '.json.gz.tmp', 'wb') as f:
+            f.write(payload)
+        os.replace(base_path + '.json.gz.tmp', base_path + '.json.gz')
+        with open(base_path + '.meta.json.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(base_path + '.meta.json.tmp', base_path + '.meta.json')
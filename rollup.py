@@ -0,0 +1,117 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from metrics import log
+
+DEFAULT_ROLLUP_FILE = 's_epi_complete_rollup.csv'
+
+# Province code (first 2 digits of areacode) -> MOPH health region (เขตสุขภาพ)
+HEALTH_REGION_BY_PROVINCE = dict(
+    {code: '01' for code in ['50', '51', '52', '54', '55', '56', '57', '58']},
+    **{code: '02' for code in ['53', '63', '64', '65', '67']},
+    **{code: '03' for code in ['18', '60', '61', '62', '66']},
+    **{code: '04' for code in ['12', '13', '14', '15', '16', '17', '19', '26']},
+    **{code: '05' for code in ['70', '71', '72', '73', '74', '75', '76', '77']},
+    **{code: '06' for code in ['11', '20', '21', '22', '23', '24', '25', '27']},
+    **{code: '07' for code in ['40', '44', '45', '46']},
+    **{code: '08' for code in ['38', '39', '41', '42', '43', '47', '48']},
+    **{code: '09' for code in ['30', '31', '32', '36']},
+    **{code: '10' for code in ['33', '34', '35', '37', '49']},
+    **{code: '11' for code in ['80', '81', '82', '83', '84', '85', '86']},
+    **{code: '12' for code in ['90', '91', '92', '93', '94', '95', '96']},
+    **{'10': '13'}
+)
+
+# Hierarchy level -> number of leading areacode digits identifying it
+AREACODE_PREFIX_LENGTHS = {'tambon': 6, 'district': 4, 'province': 2}
+LEVELS = ['tambon', 'district', 'province', 'region']
+COMPACT_EVERY = 50  # partial aggregates kept by RollupSink before they are merged
+CELL_COLUMNS = ['report_name', 'b_year', 'date']
+ROLLUP_COLUMNS = CELL_COLUMNS + ['level', 'code', 'target', 'result', 'coverage']
+
+def prefix_codes(codes, length):
+    # Vectorized str[:length] over a categorical: slices the (few) categories once
+    # and remaps the integer codes, instead of slicing every row
+    codes = codes if isinstance(codes.dtype, pd.CategoricalDtype) else codes.astype('category')
+    prefixes = codes.cat.categories.astype(str).str[:length]
+    unique, inverse = np.unique(np.asarray(prefixes), return_inverse=True)
+    row_codes = codes.cat.codes.to_numpy()
+    new_codes = np.where(row_codes >= 0, inverse[row_codes], -1)
+    return pd.Categorical.from_codes(new_codes, categories=unique)
+
+def add_hierarchy(long_df):
+    # tambon / district / province / region keys for every long-format row
+    keys = pd.DataFrame(index=long_df.index)
+    for level, length in AREACODE_PREFIX_LENGTHS.items():
+        keys[level] = prefix_codes(long_df['areacode'], length)
+    keys['region'] = keys['province'].map(HEALTH_REGION_BY_PROVINCE)
+    return keys
+
+def aggregate_cells(long_df):
+    # Summed target/result per (report_name, b_year, date, level, code), coverage not yet computed
+    keys = add_hierarchy(long_df)
+    frames = []
+    for level in LEVELS:
+        grouped = long_df[['target', 'result']].astype(np.int64).groupby(
+            [long_df['report_name'], long_df['b_year'], long_df['date'], keys[level].rename('code')],
+            observed=True, sort=False, dropna=False).sum().reset_index()
+        grouped.insert(3, 'level', level)
+        frames.append(grouped)
+    return pd.concat(frames, ignore_index=True)
+
+def finalize_cells(cells):
+    # Re-sum partial aggregates (e.g. from several chunks) and add the coverage ratio
+    cells = cells.groupby(CELL_COLUMNS + ['level', 'code'], observed=True, sort=True, dropna=False)[
+        ['target', 'result']].sum().reset_index()
+    target = cells['target'].to_numpy(dtype=np.float64)
+    cells['coverage'] = np.divide(cells['result'].to_numpy(dtype=np.float64), target,
+                                  out=np.full(len(cells), np.nan), where=target > 0)
+    return cells[ROLLUP_COLUMNS]
+
+def build_rollup(long_df):
+    return finalize_cells(aggregate_cells(long_df))
+
+def read_rollup(filename=DEFAULT_ROLLUP_FILE):
+    return pd.read_csv(filename, dtype={'code': str, 'report_name': str}, parse_dates=['date'])
+
+def merge_into_cube(cells, filename=DEFAULT_ROLLUP_FILE):
+    # Incremental maintenance: the fiscal years present in `cells` replace their old
+    # cells, every other year is kept as it is in the existing cube
+    if os.path.exists(filename):
+        existing = read_rollup(filename)
+        cells = pd.concat([existing[~existing['b_year'].isin(cells['b_year'].unique())], cells], ignore_index=True)
+    cells = cells.sort_values(CELL_COLUMNS + ['level', 'code'], kind='stable')
+    cells.to_csv(filename, index=False, date_format='%Y-%m-%d')
+    log(f"Rollup cube saved to {filename}: {len(cells)} cells.")
+    return cells
+
+def update_rollup(long_df, filename=DEFAULT_ROLLUP_FILE):
+    try:
+        log("Updating coverage rollup cube...")
+        return merge_into_cube(build_rollup(long_df), filename)
+    except Exception as e:
+        log(f"Error updating rollup cube: {e}")
+        raise
+
+class RollupSink:
+    # Streaming-pipeline sink: keeps only per-chunk partial sums (compacted every
+    # COMPACT_EVERY chunks) and merges them into the cube when the pipeline closes
+    def __init__(self, filename=DEFAULT_ROLLUP_FILE):
+        self.filename = filename
+        self.rows_written = 0
+        self._partials = []
+
+    def write(self, frame):
+        if frame.empty:
+            return
+        self._partials.append(aggregate_cells(frame))
+        self.rows_written += len(frame)
+        if len(self._partials) >= COMPACT_EVERY:
+            self._partials = [finalize_cells(pd.concat(self._partials, ignore_index=True))]
+
+    def close(self):
+        if self._partials:
+            merge_into_cube(finalize_cells(pd.concat(self._partials, ignore_index=True)), self.filename)
+            self._partials = []
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+
+from metrics import log
+
+DEFAULT_MANIFEST_DIR = 'run_manifest'
+# An interrupted run older than this starts over, so open fiscal years are never
+# resumed from yesterday's payloads
+MAX_RESUME_AGE_HOURS = 12
+
+def units_key(table_name, units):
+    # Identifies the unit set a manifest was written for
+    text = json.dumps([table_name, sorted([str(year), str(province)] for year, province in units)])
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+def read_manifest(path):
+    # (header, done, failed) of a manifest file; done/failed map (year, province) -> entry
+    header, done, failed = None, {}, {}
+    if not os.path.exists(path):
+        return header, done, failed
+    with open(path, 'r', encoding='utf-8') as f:
+        for i, line in enumerate(f):
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:  # a torn last line from a killed run
+                continue
+            if i == 0:
+                header = entry
+                continue
+            unit = (entry['year'], entry['province'])
+            if entry['status'] == 'done':
+                done[unit] = entry
+                failed.pop(unit, None)
+            else:
+                failed[unit] = entry
+    return header, done, failed
+
+def is_resumable(header, key, now, max_age_hours=MAX_RESUME_AGE_HOURS):
+    return bool(header) and header.get('key') == key and \
+        now - datetime.fromisoformat(header['started_at']) <= timedelta(hours=max_age_hours)
+
+def resumable_units(name, table_name, units, manifest_dir=DEFAULT_MANIFEST_DIR,
+                    max_age_hours=MAX_RESUME_AGE_HOURS, now=None):
+    # The units a RunManifest opened with these arguments would skip, without opening
+    # (and so without resetting) the file: what a dry run reports
+    header, done, _ = read_manifest(os.path.join(manifest_dir, f'{name}.jsonl'))
+    if not is_resumable(header, units_key(table_name, units), now or datetime.now(), max_age_hours):
+        return set()
+    return set(done)
+
+class RunManifest:
+    # Append-only checkpoint of a fetch run, one JSON line per finished (year, province) unit:
+    #   {dir}/{name}.jsonl  header line, then {"year", "province", "status", ...} entries
+    # The payloads of done units live in the response cache; on resume only the units
+    # not marked done are fetched again. The file is removed once every unit is done.
+    def __init__(self, name, table_name, units, manifest_dir=DEFAULT_MANIFEST_DIR,
+                 max_age_hours=MAX_RESUME_AGE_HOURS, now=None):
+        self.path = os.path.join(manifest_dir, f'{name}.jsonl')
+        self.units = [(str(year), str(province)) for year, province in units]
+        self.key = units_key(table_name, units)
+        now = now or datetime.now()
+        os.makedirs(manifest_dir, exist_ok=True)
+
+        header, self.done, self.failed = read_manifest(self.path)
+        if is_resumable(header, self.key, now, max_age_hours):
+            log(f"Resuming run from {self.path}: {len(self.done)} of {len(self.units)} units already done.")
+        else:
+            self.done, self.failed = {}, {}
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'key': self.key, 'table': table_name, 'units': len(self.units),
+                                    'started_at': now.isoformat(timespec='seconds')}) + '\n')
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _append(self, entry):
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def is_done(self, year, province_code):
+        return (str(year), str(province_code)) in self.done
+
+    def mark_done(self, year, province_code, size):
+        unit = (str(year), str(province_code))
+        entry = {'year': unit[0], 'province': unit[1], 'status': 'done', 'bytes': size,
+                 'completed_at': datetime.now().isoformat(timespec='seconds')}
+        self.done[unit] = entry
+        self.failed.pop(unit, None)
+        self._append(entry)
+
+    def mark_failed(self, year, province_code, error):
+        unit = (str(year), str(province_code))
+        entry = {'year': unit[0], 'province': unit[1], 'status': 'failed', 'error': str(error)}
+        self.failed[unit] = entry
+        self._append(entry)
+
+    def missing(self):
+        return [unit for unit in self.units if unit not in self.done]
+
+    def finish(self):
+        # Complete runs leave nothing behind; incomplete ones keep the file to resume from
+        self._file.close()
+        missing = self.missing()
+        if not missing:
+            os.remove(self.path)
+            log(f"Run complete: all {len(self.units)} units done, manifest removed.")
+        else:
+            log(f"Run incomplete: {len(missing)} of {len(self.units)} units missing; "
+                f"rerun to resume from {self.path}.", level='warning')
+        return missing
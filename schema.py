@@ -0,0 +1,49 @@
+import pandas as pd
+
+from metrics import log
+
+# Compact dtypes for the raw s_epi_complete rows (one row per hospcode/report/year)
+MONTHS = ['10', '11', '12', '01', '02', '03', '04', '05', '06', '07', '08', '09']
+COUNT_COLUMNS = ['target', 'result'] + [f'{kind}{month}' for month in MONTHS for kind in ('target', 'result')]
+CODE_COLUMNS = ['id', 'hospcode', 'areacode']
+
+RAW_SCHEMA = dict(
+    {'id': 'category', 'hospcode': 'category', 'areacode': 'category', 'date_com': 'Int64', 'b_year': 'int16'},
+    **{column: 'Int32' for column in COUNT_COLUMNS}
+)
+
+# Compact dtypes for the long format produced by reshape.reshape_wide_to_long()
+LONG_SCHEMA = {
+    'report_name': 'category',
+    'hospcode': 'category',
+    'areacode': 'category',
+    'b_year': 'int16',
+    'date': 'datetime64[ns]',
+    'target': 'int32',
+    'result': 'int32'
+}
+
+# dtype= for pd.read_csv on a raw CSV: codes stay strings so leading zeros survive
+RAW_CSV_DTYPES = dict({column: str for column in CODE_COLUMNS}, date_com=str)
+
+def apply_schema(df, schema):
+    # Casts only the columns present in df whose dtype differs from the schema
+    casts = {column: dtype for column, dtype in schema.items()
+             if column in df.columns and str(df[column].dtype) != dtype}
+    if 'date_com' in casts:
+        df['date_com'] = pd.to_numeric(df['date_com'], errors='coerce')
+    return df.astype(casts, copy=False) if casts else df
+
+def apply_raw_schema(df):
+    return apply_schema(df, RAW_SCHEMA)
+
+def apply_long_schema(df):
+    return apply_schema(df, LONG_SCHEMA)
+
+def memory_report(df, stage):
+    # Deep memory usage per column in MB, plus the total, logged under `stage`
+    usage = df.memory_usage(deep=True, index=False) / 1024 ** 2
+    report = {'stage': stage, 'rows': len(df), 'total_mb': round(float(usage.sum()), 2),
+              'columns_mb': {column: round(float(mb), 2) for column, mb in usage.items()}}
+    log(f"[memory] {stage}: {report['rows']} rows, {report['total_mb']} MB")
+    return report
@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+
+from gazpacho import Soup
+
+from html_tables import etree, extract_rows
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metrics import log
+
+SAVED_PAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'search_hospital', 'ค้นหารพสต..html')
+ROW_COUNTS = [100, 1000, 5000]
+REPEATS = 3
+
+def gazpacho_rows(html):
+    # The per-cell gazpacho path the scrapers used before html_tables
+    table_body = Soup(html).find('tbody')
+    rows = table_body.find('tr', mode='all') if table_body else []
+    if not isinstance(rows, list):  # gazpacho returns a single element when there is one match
+        rows = [rows]
+    parsed = []
+    for row in rows:
+        cells = row.find('td', mode='all')
+        cells = cells if isinstance(cells, list) else [cells]
+        parsed.append([cell.text for cell in cells])
+    return parsed
+
+def result_page(template, n_rows):
+    # The saved page is the search form without a result table, so splice a
+    # village-style table of n_rows Thai rows in front of its </body>
+    rows = ''.join(
+        f"<tr><td>จังหวัดทดสอบ</td><td>อำเภอ{i % 50}</td><td>ตำบล{i % 400}</td>"
+        f"<td>บ้านหมู่ที่ {i % 20} &amp; ทดสอบ</td><td>{i:05d}</td><td>{(i * 7) % 100000:05d}</td></tr>\n"
+        for i in range(n_rows))
+    table = f"<table class=\"table\"><thead><tr><th>จังหวัด</th></tr></thead><tbody>\n{rows}</tbody></table>"
+    return template.replace('</body>', table + '</body>', 1)
+
+def best_time(function, html):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = function(html)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+def run_benchmark(page_path=SAVED_PAGE, row_counts=ROW_COUNTS):
+    with open(page_path, 'r', encoding='utf-8') as f:
+        template = f.read()
+    log(f"Extractor backend: {'lxml' if etree is not None else 'html.parser'}")
+    for n_rows in row_counts:
+        html = result_page(template, n_rows)
+        gazpacho_seconds, expected = best_time(gazpacho_rows, html)
+        extractor_seconds, rows = best_time(extract_rows, html)
+        if rows != expected:
+            raise AssertionError(f"Extractor output differs from gazpacho on {n_rows} rows")
+        log(f"{n_rows:>6} rows ({len(html) / 1e6:.2f} MB): gazpacho {gazpacho_seconds:.3f}s, "
+            f"extractor {extractor_seconds:.4f}s, {gazpacho_seconds / extractor_seconds:.0f}x faster")
+
+if __name__ == '__main__':
+    run_benchmark(row_counts=[int(n) for n in sys.argv[1:]] or ROW_COUNTS)
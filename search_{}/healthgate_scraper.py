@@ -0,0 +1,212 @@
+import asyncio
+import csv
+import os
+import random
+import sys
+import time
+from urllib.parse import quote
+
+import aiohttp
+from gazpacho import Soup
+
+from html_tables import extract_rows
+from snapshot_store import DEFAULT_SNAPSHOT_DIR, SnapshotStore, diff_rows, is_empty_diff
+
+# metrics.log is shared with the pipeline modules one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metrics import log
+
+BASE_URL = "https://healthgate.hss.moph.go.th"
+
+# Per-endpoint search page, province <select>, result URL and output columns
+ENDPOINTS = {
+    'hospital': {
+        'main_url': f"{BASE_URL}/search-hospital",
+        'select': {'id': 'search_province'},
+        'option_value': 'text',
+        'url': f"{BASE_URL}/search/hospital?search_province={{}}",
+        'columns': ["จังหวัด", "อำเภอ", "ตำบล", "ชื่อหน่วยงาน/รพสต.", "Login Code"]
+    },
+    'village': {
+        'main_url': f"{BASE_URL}/search-village",
+        'select': {'id': 'search_province'},
+        'option_value': 'text',
+        'url': f"{BASE_URL}/search/village?search_province={{}}",
+        'columns': ["จังหวัด", "อำเภอ", "ตำบล", "ชื่อหมู่บ้าน", "Login Code", "รหัส รพ.สต"]
+    },
+    'tambon': {
+        'main_url': f"{BASE_URL}/search-tambon",
+        'select': {'name': 'province'},
+        'option_value': 'value',
+        'url': f"{BASE_URL}/search/tambon?province={{}}",
+        'columns': ["จังหวัด", "อำเภอ", "ตำบล", "Login Code"]
+    },
+    'school': {
+        'main_url': f"{BASE_URL}/search-school",
+        'select': {'id': 'search_province'},
+        'option_value': 'text',
+        'url': f"{BASE_URL}/search/school?search_province={{}}",
+        'columns': ["จังหวัด", "อำเภอ", "ตำบล", "ชื่อโรงเรียน", "Login Code", "รหัส รพ.สต"]
+    }
+}
+
+# Every endpoint's rows are identified by their Login Code when diffing snapshots
+KEY_COLUMNS = ["Login Code"]
+
+# Be polite to healthgate: few connections and a minimum gap between request starts
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_MIN_INTERVAL = 0.25  # seconds
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0  # seconds, doubled on every retry
+REQUEST_TIMEOUT = 120  # seconds
+
+def parse_province_options(html, endpoint):
+    config = ENDPOINTS[endpoint]
+    options = Soup(html).find('select', config['select']).find('option', mode='all')[1:]  # skip the placeholder
+    if config['option_value'] == 'text':
+        return [option.text for option in options]
+    return [option.attrs['value'] for option in options]
+
+class RateLimiter:
+    # Spaces request starts at least `min_interval` seconds apart
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._lock = asyncio.Lock()
+        self._next_start = 0.0
+
+    async def wait(self):
+        async with self._lock:
+            delay = self._next_start - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_start = time.monotonic() + self.min_interval
+
+async def fetch_response(session, url, semaphore, rate_limiter, headers=None, max_retries=MAX_RETRIES):
+    # GET with exponential backoff plus jitter on connection errors, 429 and 5xx.
+    # Returns (status, body bytes, response headers); status is 200, or 304 for a
+    # conditional GET whose validators still match.
+    for attempt in range(max_retries + 1):
+        async with semaphore:
+            await rate_limiter.wait()
+            try:
+                async with session.get(url, headers=headers) as response:
+                    if response.status in (200, 304):
+                        return response.status, await response.read(), response.headers
+                    if response.status != 429 and response.status < 500:
+                        raise RuntimeError(f"HTTP {response.status} for {url}")
+                    error = f"HTTP {response.status}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+        if attempt == max_retries:
+            raise RuntimeError(f"Giving up on {url} after {max_retries + 1} attempts: {error}")
+        delay = BACKOFF_BASE * 2 ** attempt * (0.5 + random.random())
+        log(f"Retrying {url} in {delay:.1f}s ({error})")
+        await asyncio.sleep(delay)
+
+async def fetch_text(session, url, semaphore, rate_limiter, max_retries=MAX_RETRIES):
+    _, body, _ = await fetch_response(session, url, semaphore, rate_limiter, max_retries=max_retries)
+    return body.decode('utf-8')
+
+class CsvRowWriter:
+    # Appends each province's rows as soon as they are parsed
+    def __init__(self, filename, columns):
+        self._file = open(filename, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+        self.rows_written = 0
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+        self.rows_written += len(rows)
+
+    def close(self):
+        self._file.close()
+
+async def scrape_province(session, endpoint, province, semaphore, rate_limiter, writer, parse_rows, store=None):
+    # Returns (row count, diff); the diff is None when the province did not change
+    url = ENDPOINTS[endpoint]['url'].format(quote(province))
+    headers = store.conditional_headers(province) if store else None
+    status, body, response_headers = await fetch_response(session, url, semaphore, rate_limiter, headers)
+    if store and (status == 304 or store.is_unchanged(province, body)):
+        # Validators or body hash match: reuse the stored rows without parsing
+        rows = store.read_rows(province)
+        writer.write(rows)
+        return len(rows), None
+
+    rows = await asyncio.get_running_loop().run_in_executor(None, parse_rows, body)
+    writer.write(rows)
+    diff = None
+    if store:
+        columns = ENDPOINTS[endpoint]['columns']
+        key_index = [columns.index(column) for column in KEY_COLUMNS]
+        diff = diff_rows(store.read_rows(province), rows, key_index)
+        store.put(province, rows, body, response_headers)
+    return len(rows), diff
+
+async def scrape_async(endpoint, output_file, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                       min_interval=DEFAULT_MIN_INTERVAL, provinces=None, parse_rows=extract_rows,
+                       snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+    semaphore = asyncio.Semaphore(max_concurrency)
+    rate_limiter = RateLimiter(min_interval)
+    store = SnapshotStore(endpoint, snapshot_dir) if snapshot_dir else None
+    connector = aiohttp.TCPConnector(limit=max_concurrency, keepalive_timeout=60)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        if provinces is None:
+            main_html = await fetch_text(session, ENDPOINTS[endpoint]['main_url'], semaphore, rate_limiter)
+            provinces = parse_province_options(main_html, endpoint)
+        log(f"Scraping {endpoint} for {len(provinces)} provinces...")
+
+        # Written next to output_file and only moved over it once every province has rows
+        staged_file = output_file + '.tmp'
+        writer = CsvRowWriter(staged_file, ENDPOINTS[endpoint]['columns'])
+        try:
+            results = await asyncio.gather(
+                *[scrape_province(session, endpoint, province, semaphore, rate_limiter, writer, parse_rows, store)
+                  for province in provinces],
+                return_exceptions=True)
+
+            # A province that still fails after retries keeps its last good rows from the
+            # snapshot store; without a snapshot the CSV would be missing it, so it is not published
+            failed = [(province, result) for province, result in zip(provinces, results)
+                      if isinstance(result, Exception)]
+            missing = []
+            for province, error in failed:
+                stale = store.read_rows(province) if store and store.read_meta(province) else None
+                if stale is None:
+                    missing.append(province)
+                else:
+                    writer.write(stale)
+                log(f"Failed to scrape {endpoint} for province {province}: {error}"
+                    f"{'' if stale is None else f'; kept its {len(stale)} rows from the last snapshot'}")
+        finally:
+            writer.close()
+
+    if missing:
+        os.remove(staged_file)
+        log(f"{output_file} not updated: no snapshot to fall back on for {len(missing)} failed provinces "
+            f"({', '.join(missing)}).")
+    else:
+        os.replace(staged_file, output_file)
+        log(f"Scraped {writer.rows_written} {endpoint} rows into {output_file} "
+            f"({len(provinces) - len(failed)} provinces ok, {len(failed)} failed).")
+
+    if store:
+        diffs = {province: result[1] for province, result in zip(provinces, results)
+                 if not isinstance(result, Exception) and result[1] is not None and not is_empty_diff(result[1])}
+        for province, diff in diffs.items():
+            log(f"{endpoint} {province}: +{len(diff['added'])} -{len(diff['removed'])} ~{len(diff['changed'])}")
+        log(f"{len(diffs)} {endpoint} provinces changed; diff saved to {store.write_diff(diffs)}.")
+    return [province for province, _ in failed]
+
+def scrape(endpoint, output_file=None, max_concurrency=DEFAULT_MAX_CONCURRENCY, min_interval=DEFAULT_MIN_INTERVAL,
+           provinces=None, snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+    output_file = output_file or f'search_{endpoint}.csv'
+    return asyncio.run(scrape_async(endpoint, output_file, max_concurrency, min_interval, provinces,
+                                    snapshot_dir=snapshot_dir))
+
+if __name__ == '__main__':
+    # e.g. python healthgate_scraper.py village; exits 1 when any province failed
+    failed_provinces = [province for name in sys.argv[1:] or list(ENDPOINTS) for province in scrape(name)]
+    sys.exit(1 if failed_provinces else 0)
@@ -0,0 +1,97 @@
+from html.parser import HTMLParser
+
+try:
+    from lxml import etree
+except ImportError:  # fall back to the standard library parser
+    etree = None
+
+DEFAULT_ENCODING = 'utf-8'  # healthgate pages declare <meta charset="utf-8">
+
+class _StdlibRowParser(HTMLParser):
+    # Same event-driven extraction on html.parser when lxml is not installed
+    def __init__(self, on_row):
+        super().__init__(convert_charrefs=True)
+        self.on_row = on_row
+        self._in_body = False
+        self._row = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'tbody':
+            self._in_body = True
+        elif self._in_body and tag == 'tr':
+            self._row = []
+        elif self._row is not None and tag == 'td':
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if tag == 'td' and self._cell is not None:
+            self._row.append(''.join(self._cell).strip())
+            self._cell = None
+        elif tag == 'tr' and self._row is not None:
+            self.on_row(self._row)
+            self._row = None
+        elif tag == 'tbody':
+            self._in_body = False
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+class TableExtractor:
+    # Streams the <tbody> rows of a result page into per-column lists.
+    # feed() accepts str or bytes chunks as they arrive, so a page never has to be
+    # held as a tree: every finished <tr> is read and then cleared from memory.
+    def __init__(self, encoding=DEFAULT_ENCODING):
+        self.columns = []
+        self.row_count = 0
+        self._encoding = encoding
+        if etree is not None:
+            self._parser = etree.HTMLPullParser(events=('end',), tag=('tr', 'tbody'), encoding=encoding)
+        else:
+            self._parser = _StdlibRowParser(self._add_row)
+
+    def _add_row(self, cells):
+        for _ in range(len(self.columns), len(cells)):
+            # A wider row than seen so far: pad the new column for the earlier rows
+            self.columns.append([None] * self.row_count)
+        for i, column in enumerate(self.columns):
+            column.append(cells[i] if i < len(cells) else None)
+        self.row_count += 1
+
+    def _drain(self):
+        for _, element in self._parser.read_events():
+            if element.tag == 'tr':
+                parent = element.getparent()
+                if parent is not None and parent.tag == 'tbody':
+                    self._add_row([''.join(cell.itertext()).strip() for cell in element.iterchildren('td')])
+                    element.clear()
+                    # Drop the finished rows already read so memory stays flat on large pages
+                    while element.getprevious() is not None:
+                        del parent[0]
+            else:
+                element.clear()
+
+    def feed(self, chunk):
+        if etree is not None:
+            self._parser.feed(chunk.encode(self._encoding) if isinstance(chunk, str) else chunk)
+            self._drain()
+        else:
+            self._parser.feed(chunk.decode(self._encoding) if isinstance(chunk, bytes) else chunk)
+
+    def close(self):
+        if etree is not None:
+            self._parser.close()
+            self._drain()
+        else:
+            self._parser.close()
+        return self.columns
+
+def extract_columns(html, encoding=DEFAULT_ENCODING):
+    extractor = TableExtractor(encoding)
+    extractor.feed(html)
+    return extractor.close()
+
+def extract_rows(html, encoding=DEFAULT_ENCODING):
+    # Row lists in page order, the shape the CSV writers expect
+    return [list(row) for row in zip(*extract_columns(html, encoding))]
@@ -0,0 +1,120 @@
+import gzip
+import hashlib
+import json
+import os
+from collections import Counter
+from datetime import datetime, timezone
+
+DEFAULT_SNAPSHOT_DIR = 'scrape_snapshots'
+
+def body_hash(body):
+    return hashlib.sha256(body).hexdigest()
+
+def diff_rows(old_rows, new_rows, key_index):
+    # Compact province diff: rows only in the new scrape, rows only in the old one,
+    # and rows whose key (e.g. Login Code) is in both but whose other cells changed
+    old_counts = Counter(map(tuple, old_rows))
+    new_counts = Counter(map(tuple, new_rows))
+    added = list((new_counts - old_counts).elements())
+    removed = list((old_counts - new_counts).elements())
+
+    def key(row):
+        return tuple(row[i] if i < len(row) else None for i in key_index)
+
+    removed_by_key = {key(row): row for row in removed}
+    changed = [{'old': list(removed_by_key[key(row)]), 'new': list(row)}
+               for row in added if key(row) in removed_by_key]
+    changed_keys = {key(pair['new']) for pair in changed}
+    return {'added': [list(row) for row in added if key(row) not in changed_keys],
+            'removed': [list(row) for row in removed if key(row) not in changed_keys],
+            'changed': changed}
+
+def is_empty_diff(diff):
+    return not (diff['added'] or diff['removed'] or diff['changed'])
+
+class SnapshotStore:
+    # Last scraped rows and response validators per (endpoint, province):
+    #   {dir}/{endpoint}/{province}.json.gz   rows of the last scrape
+    #   {dir}/{endpoint}/{province}.meta.json ETag, Last-Modified, body hash, row count
+    #   {dir}/{endpoint}/diff.json            per-province diffs of the latest run
+    def __init__(self, endpoint, snapshot_dir=DEFAULT_SNAPSHOT_DIR):
+        self.endpoint = endpoint
+        self.root = os.path.join(snapshot_dir, endpoint)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, province, suffix):
+        return os.path.join(self.root, str(province).replace('/', '_') + suffix)
+
+    def read_meta(self, province):
+        path = self._path(province, '.meta.json')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def read_rows(self, province):
+        path = self._path(province, '.json.gz')
+        if not os.path.exists(path):
+            return []
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return json.load(f)
+
+    def conditional_headers(self, province):
+        # Validators for a conditional GET; only sent when the rows they describe are stored
+        meta = self.read_meta(province)
+        if not meta or not os.path.exists(self._path(province, '.json.gz')):
+            return {}
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers
+
+    def is_unchanged(self, province, body):
+        meta = self.read_meta(province)
+        return bool(meta) and meta.get('body_sha256') == body_hash(body) and \
+            os.path.exists(self._path(province, '.json.gz'))
+
+    def _write_atomic(self, path, write):
+        tmp_path = path + '.tmp'
+        write(tmp_path)
+        os.replace(tmp_path, path)
+
+    def put(self, province, rows, body, response_headers):
+        def write_rows(path):
+            with gzip.open(path, 'wt', encoding='utf-8') as f:
+                json.dump(rows, f, ensure_ascii=False)
+
+        def write_meta(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'etag': response_headers.get('ETag'),
+                           'last_modified': response_headers.get('Last-Modified'),
+                           'body_sha256': body_hash(body),
+                           'row_count': len(rows),
+                           'fetched_at': datetime.now(timezone.utc).isoformat(timespec='seconds')}, f)
+
+        self._write_atomic(self._path(province, '.json.gz'), write_rows)
+        self._write_atomic(self._path(province, '.meta.json'), write_meta)
+
+    def write_diff(self, diffs):
+        # Only provinces that changed are listed, so downstream joins rebuild just those
+        def write(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({'generated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                           'changed_provinces': sorted(diffs), 'provinces': diffs}, f, ensure_ascii=False)
+
+        path = os.path.join(self.root, 'diff.json')
+        self._write_atomic(path, write)
+        return path
+
+    def read_diff(self):
+        path = os.path.join(self.root, 'diff.json')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def changed_provinces(self):
+        diff = self.read_diff()
+        return diff['changed_provinces'] if diff else None
@@ -0,0 +1,90 @@
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+from shapely.strtree import STRtree
+
+from metrics import log
+
+# Boundary layers with their polygon code field and the areacode prefix length the code matches
+LAYERS = {
+    'province': {'path': 'gdf2.geojson', 'code_column': 'id', 'areacode_digits': 2},
+    'district': {'path': 'gdf3.geojson', 'code_column': 'id', 'areacode_digits': 4}
+}
+
+def _read_polygons(path, code_column):
+    # GeoJSON is read with shapely alone; other formats (shapefiles, GeoParquet) go through geopandas
+    if path.endswith('.geojson') or path.endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            features = [feature for feature in json.load(f)['features'] if feature['geometry']]
+        return ([shape(feature['geometry']) for feature in features],
+                [str(feature['properties'][code_column]) for feature in features])
+    import geopandas as gpd
+    frame = gpd.read_parquet(path) if path.endswith('.parquet') else gpd.read_file(path)
+    frame = frame[frame.geometry.notna()]
+    return list(frame.geometry), frame[code_column].astype(str).tolist()
+
+class PolygonIndex:
+    # STR-tree over one boundary layer, queried with whole arrays of points at once
+    def __init__(self, geometries, codes):
+        self.geometries = np.asarray(geometries, dtype=object)
+        self.codes = np.asarray(codes, dtype=object)
+        self.tree = STRtree(self.geometries)
+
+    def assign(self, lon, lat):
+        # Index of the containing polygon for every point, -1 for points in no polygon.
+        # A point on a shared edge takes the first polygon the tree reports.
+        points = shapely.points(np.asarray(lon, dtype=np.float64), np.asarray(lat, dtype=np.float64))
+        point_index, polygon_index = self.tree.query(points, predicate='intersects')
+        assigned = np.full(len(points), -1, dtype=np.int64)
+        first_point, first_match = np.unique(point_index, return_index=True)
+        assigned[first_point] = polygon_index[first_match]
+        return assigned
+
+    def assign_codes(self, lon, lat):
+        assigned = self.assign(lon, lat)
+        return np.where(assigned >= 0, self.codes[np.clip(assigned, 0, None)], None)
+
+@lru_cache(maxsize=None)
+def load_polygon_index(path, code_column):
+    # Built once per (file, code field) and reused for every later call in the process
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Boundary file not found: {path}")
+    geometries, codes = _read_polygons(path, code_column)
+    log(f"Built STR-tree over {len(geometries)} polygons from {path}.")
+    return PolygonIndex(geometries, codes)
+
+def hospital_areacodes(long_df):
+    # Most frequent areacode reported for each hospcode in the EPI data
+    counts = long_df.groupby(['hospcode', 'areacode'], observed=True).size().reset_index(name='rows')
+    counts = counts.sort_values(['hospcode', 'rows'], ascending=[True, False], kind='stable')
+    return counts.drop_duplicates('hospcode').set_index('hospcode')['areacode'].astype(str)
+
+def check_hospital_locations(hospitals, layer='district', lon_column='lon', lat_column='lat',
+                             areacode_column='areacode', long_df=None):
+    # Assigns every hospital point to a polygon of `layer` and flags points that fall
+    # in no polygon ('outside') or whose polygon disagrees with their areacode ('mismatch').
+    # Hospitals without an areacode column are checked against the areacode they report
+    # most often in long_df, when given.
+    config = LAYERS[layer]
+    index = load_polygon_index(config['path'], config['code_column'])
+    report = hospitals.copy()
+    if areacode_column not in report.columns and long_df is not None:
+        report[areacode_column] = report['hospcode'].astype(str).map(hospital_areacodes(long_df))
+    report['polygon_code'] = index.assign_codes(report[lon_column], report[lat_column])
+
+    status = np.full(len(report), 'ok', dtype=object)
+    if areacode_column in report.columns:
+        expected = report[areacode_column].astype('string').str[:config['areacode_digits']]
+        status[expected.isna().to_numpy()] = 'no_areacode'
+        mismatch = (expected != report['polygon_code'].astype('string')).fillna(False).to_numpy(dtype=bool)
+        status[mismatch] = 'mismatch'
+    status[report['polygon_code'].isna().to_numpy()] = 'outside'
+    report['status'] = status
+
+    summary = report['status'].value_counts().to_dict()
+    log(f"Spatial join against {layer}: {summary}")
+    return report
@@ -0,0 +1,114 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+
+from async_fetch import (DEFAULT_MAX_CONCURRENCY, REQUEST_TIMEOUT, AdaptiveLimiter, close_manifest, fetch_payload,
+                         get_current_year_be, get_province_codes, open_manifest, record_unit_rows)
+from fast_decode import decode_payload
+from metrics import METRICS, log
+
+# Fetched payloads waiting to be transformed. Once it is full the fetch workers
+# block, so at most DEFAULT_QUEUE_SIZE + max_concurrency payloads are in memory.
+DEFAULT_QUEUE_SIZE = 8
+
+class CsvSink:
+    # Appends each transformed chunk to one CSV, writing the header only once
+    def __init__(self, filename):
+        self.filename = filename
+        self.rows_written = 0
+        self._file = open(filename, 'w', newline='', encoding='utf-8')
+
+    def write(self, frame):
+        if frame.empty:
+            return
+        METRICS.increment('rows_written', len(frame), sink='csv')
+        frame.to_csv(self._file, index=False, header=self.rows_written == 0)
+        self.rows_written += len(frame)
+
+    def close(self):
+        self._file.close()
+
+class TeeSink:
+    # Fans each chunk out to several sinks, e.g. the CSV and the Parquet dataset
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    @property
+    def rows_written(self):
+        return self.sinks[0].rows_written if self.sinks else 0
+
+    def write(self, frame):
+        for sink in self.sinks:
+            sink.write(frame)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+async def _fetch_worker(session, limiter, units, queue, table_name, cache, manifest, payloads):
+    # Each worker pulls the next unit only after its previous payload has been
+    # handed to the transform queue, which is what applies the backpressure.
+    while units:
+        year, province_code = units.pop()
+        payload = await fetch_payload(session, limiter, year, province_code, table_name, cache, manifest)
+        payloads[(year, province_code)] = payload is not None
+        await queue.put((year, province_code, payload))
+
+def _timed(stage, function, *args):
+    with METRICS.timer(stage):
+        return function(*args)
+
+async def _transform_worker(queue, unit_count, transform, sink, executor):
+    loop = asyncio.get_running_loop()
+    for _ in range(unit_count):
+        year, province_code, payload = await queue.get()
+        if payload:
+            # Parse and reshape off the event loop so the fetchers keep the network busy
+            frame = await loop.run_in_executor(executor, _timed, 'parse', decode_payload, payload)
+            record_unit_rows(year, province_code, frame)
+            # A unit without records comes back as [], which parses to a frame without columns:
+            # its 0 rows are recorded, but there is nothing to transform or write
+            if not frame.empty:
+                transformed = await loop.run_in_executor(executor, _timed, 'transform', transform, frame)
+                await loop.run_in_executor(executor, _timed, 'save', sink.write, transformed)
+        queue.task_done()
+
+async def stream_fetch_transform(units, transform, sink, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                                 queue_size=DEFAULT_QUEUE_SIZE, table_name="s_epi_complete", cache=None,
+                                 manifest=None):
+    # Returns {unit: fetched?} so the caller can tell a complete run from a partial one
+    queue = asyncio.Queue(maxsize=queue_size)
+    pending = list(reversed(units))  # pop() from the end keeps the original unit order
+    limiter = AdaptiveLimiter(max_concurrency)
+    fetched = {}
+    connector = aiohttp.TCPConnector(limit=max_concurrency, keepalive_timeout=60)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    # A single transform thread keeps sink writes strictly sequential
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            fetchers = [_fetch_worker(session, limiter, pending, queue, table_name, cache, manifest, fetched)
+                        for _ in range(max_concurrency)]
+            await asyncio.gather(_transform_worker(queue, len(units), transform, sink, executor), *fetchers)
+    return fetched
+
+def run_streaming_pipeline(transform, sink, years=None, province_codes=None, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                           queue_size=DEFAULT_QUEUE_SIZE, table_name="s_epi_complete", cache=None, manifest_name=None):
+    # With a manifest_name, finished units are checkpointed; rerunning after a failure
+    # replays them from the response cache into the sinks and only fetches the rest.
+    if years is None:
+        years = range(2557, get_current_year_be())
+    if province_codes is None:
+        province_codes = get_province_codes()
+
+    units = [(year, province_code) for year in years for province_code in province_codes]
+    manifest, cache = open_manifest(manifest_name, table_name, units, cache)
+    log(f"Streaming {len(units)} (year, province) units through fetch -> transform -> sink...")
+    try:
+        with METRICS.timer('pipeline'):
+            fetched = asyncio.run(stream_fetch_transform(units, transform, sink, max_concurrency, queue_size,
+                                                         table_name, cache, manifest))
+    finally:
+        sink.close()
+    close_manifest(manifest, [fetched.get(unit) or None for unit in units], units)
+    log(f"Streaming pipeline complete: {sink.rows_written} rows written.")
@@ -0,0 +1,59 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from metrics import log
+from schema import RAW_CSV_DTYPES
+
+SAMPLE_FILE = 'Test/sample_data_all.csv'
+# Raw rows at scale 1x, roughly one fiscal year of s_epi_complete for a health region
+BASE_ROWS = 20000
+DEFAULT_SEED = 2567
+HOSPCODE_STRIDE = 7919  # prime offset that spreads replicated hospcodes over the 5-digit space
+
+def load_sample(sample_file=SAMPLE_FILE):
+    return pd.read_csv(sample_file, dtype=RAW_CSV_DTYPES)
+
+def generate_raw(scale=1, sample=None, base_rows=BASE_ROWS, seed=DEFAULT_SEED):
+    # Resamples whole sample rows, so the id / b_year mix, the monthly count profiles and
+    # their nulls keep the sample's joint distribution. Every further copy of the sample
+    # gets its own hospcodes (the areacode, and so the province mix, is kept), so the
+    # number of distinct hospitals grows with the row count as it does in the real table.
+    # Each copy is a shuffle of the sample rather than a draw with replacement, so no key repeats.
+    sample = load_sample() if sample is None else sample
+    n_rows = int(base_rows * scale)
+    rng = np.random.default_rng(seed)
+    copies = -(-n_rows // len(sample))
+    picks = np.argsort(rng.random((copies, len(sample))), axis=1).ravel()[:n_rows]
+    synthetic = sample.iloc[picks].reset_index(drop=True)
+
+    replica = np.arange(n_rows, dtype=np.int64) // len(sample)
+    hospcodes = pd.to_numeric(synthetic['hospcode'], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+    shifted = (hospcodes + HOSPCODE_STRIDE * replica) % 100000
+    synthetic['hospcode'] = pd.Series(shifted).map('{:05d}'.format)
+    return synthetic
+
+def write_raw_csv(filename, scale=1, sample=None, seed=DEFAULT_SEED):
+    synthetic = generate_raw(scale, sample, seed=seed)
+    synthetic.to_csv(filename, index=False)
+    log(f"Synthetic raw data saved to {filename}: {len(synthetic)} rows ({scale}x).")
+    return filename
+
+def raw_payloads(raw):
+    # The raw frame split the way the API returns it: JSON bytes per (b_year, province)
+    # unit, with the counts as numbers like the live report_data responses
+    payloads = {}
+    units = [raw['b_year'].astype(int).astype(str), raw['areacode'].str[:2].rename('province')]
+    for key, group in raw.groupby(units, sort=True):
+        records = group.to_dict(orient='records')
+        for record in records:
+            for column, value in record.items():
+                if isinstance(value, float):
+                    record[column] = None if np.isnan(value) else int(value)
+        payloads[key] = json.dumps(records).encode('utf-8')
+    return payloads
+
+if __name__ == '__main__':
+    for scale in (1, 10, 100):
+        write_raw_csv(f'synthetic_data_{scale}x.csv', scale)
@@ -0,0 +1,64 @@
+from async_fetch import FIRST_YEAR_BE, get_current_year_be, get_province_codes
+from quality_gate import DEFAULT_LEDGER_FILE, check_raw
+from reshape import ID_TO_NAME
+from schema import RAW_SCHEMA
+
+# report_data is requested per (tableName, year, partition); the partition key names the
+# request field that splits a year and where its values come from
+PARTITION_VALUES = {
+    'province': get_province_codes
+}
+
+class TableSpec:
+    # One MOPH report_data table: which years exist, how a year is split into requests,
+    # the dtypes its rows are cast to, the report ids it carries (id -> short name), and
+    # the quality check its rows must pass before they are written: check(raw, expected
+    # partitions) -> gate, raising when they fail, like quality_gate.check_raw. The ledger
+    # file keeps the (year, partition) units that returned rows last time.
+    def __init__(self, name, check, first_year=FIRST_YEAR_BE, last_year=None, partition_key='province',
+                 schema=None, reports=None, ledger_file=None):
+        if partition_key not in PARTITION_VALUES:
+            raise ValueError(f"partition_key must be one of {sorted(PARTITION_VALUES)}, got {partition_key!r}")
+        self.name = name
+        self.check = check
+        self.ledger_file = ledger_file or f'{name}_partitions.json'
+        self.first_year = first_year
+        self.last_year = last_year
+        self.partition_key = partition_key
+        self.schema = schema or {}
+        self.reports = reports or {}
+
+    def years(self, years=None):
+        # Requested years clipped to the table's range; by default every closed fiscal year
+        last_year = self.last_year if self.last_year is not None else get_current_year_be()
+        if years is None:
+            years = range(self.first_year, get_current_year_be())
+        return [year for year in years if self.first_year <= int(year) <= last_year]
+
+    def partitions(self, values=None):
+        return list(values) if values is not None else PARTITION_VALUES[self.partition_key]()
+
+    def units(self, years=None, partitions=None):
+        return [(year, partition) for year in self.years(years) for partition in self.partitions(partitions)]
+
+    def __repr__(self):
+        return f"TableSpec({self.name!r}, years {self.first_year}-{self.last_year or 'now'}, by {self.partition_key})"
+
+# The 1yr/2yr/3yr/5yr/7yr coverage reports are rows of s_epi_complete told apart by `id`,
+# so one s_epi_complete request already returns all of them, and it is the only table
+# catalogued so far. Another report_data table is one more entry here, with its schema and
+# a quality check for its columns; fetch_catalog() then adds only its own requests to the run.
+# s_epi_complete shares its ledger with `cli.py fetch`, which fetches the same units.
+CATALOG = {spec.name: spec for spec in [
+    TableSpec('s_epi_complete', check_raw, first_year=FIRST_YEAR_BE, schema=RAW_SCHEMA, reports=ID_TO_NAME,
+              ledger_file=DEFAULT_LEDGER_FILE),
+]}
+
+def get_table(name):
+    if name not in CATALOG:
+        raise KeyError(f"Unknown table {name!r}; catalogued tables: {', '.join(sorted(CATALOG))}")
+    return CATALOG[name]
+
+def register_table(spec):
+    CATALOG[spec.name] = spec
+    return spec
@@ -0,0 +1,34 @@
+import os
+import sys
+from contextlib import ExitStack
+
+import pytest
+
+# The pipeline modules live flat in the repository root
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+SAMPLE_FILE = os.path.join(ROOT_DIR, 'Test', 'sample_data_all.csv')
+
+@pytest.fixture
+def sample_raw():
+    # The 326 real raw rows in Test/, typed like a fresh fetch; includes a row with a null id
+    from schema import apply_raw_schema
+    from synthetic_data import load_sample
+
+    return apply_raw_schema(load_sample(SAMPLE_FILE))
+
+@pytest.fixture
+def serve_raw(monkeypatch):
+    # serve_raw(raw) puts raw CSV rows behind the in-process mock API, one payload per
+    # (year, province) like report_data; any other unit gets the API's empty answer, []
+    import async_fetch
+    from mock_api import MockApi, payload_source, running_mock_api
+    from synthetic_data import raw_payloads
+
+    with ExitStack() as stack:
+        def serve(raw):
+            mock = MockApi(payload_source(raw_payloads(raw)))
+            monkeypatch.setattr(async_fetch, 'API_URL', stack.enter_context(running_mock_api(mock)))
+            return mock
+        yield serve
@@ -0,0 +1,77 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import async_fetch
+from catalog_fetch import fetch_catalog, publish_tables
+from cli import main
+from mock_api import MockApi, running_mock_api
+from quality_gate import DEFAULT_LEDGER_FILE, PartitionLedger, QualityError, check_raw
+from reshape import ID_TO_NAME
+from response_cache import ResponseCache
+from schema import RAW_SCHEMA
+from synthetic_data import load_sample, raw_payloads
+from table_catalog import CATALOG, TableSpec
+
+from conftest import SAMPLE_FILE
+
+PROVINCES = ['19', '30', '50']
+
+def test_fetch_tables_publishes_checked_rows(serve_raw, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sample = load_sample(SAMPLE_FILE)
+    serve_raw(sample)
+    main(['fetch-tables', '--years', '2557-2558', '--provinces', ','.join(PROVINCES)])
+
+    written = pd.read_csv('s_epi_complete_data_all.csv', dtype={'areacode': str})
+    in_units = sample['b_year'].isin([2557, 2558]) & sample['areacode'].str[:2].isin(PROVINCES)
+    assert len(written) == in_units.sum()
+    # s_epi_complete shares its ledger with `cli.py fetch`
+    assert CATALOG['s_epi_complete'].ledger_file == DEFAULT_LEDGER_FILE
+    assert PartitionLedger().expected([2557, 2558], PROVINCES)
+
+def test_fetch_tables_writes_nothing_when_the_check_fails(serve_raw, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sample = load_sample(SAMPLE_FILE)
+    serve_raw(sample.assign(result=sample['target'] + 1))
+    with pytest.raises(QualityError):
+        main(['fetch-tables', '--years', '2557-2558', '--provinces', ','.join(PROVINCES)])
+    assert not os.path.exists('s_epi_complete_data_all.csv')
+    assert not os.path.exists(DEFAULT_LEDGER_FILE)
+
+def test_second_table_shares_the_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(CATALOG, 's_epi_extra', TableSpec('s_epi_extra', check_raw, schema=RAW_SCHEMA, reports=ID_TO_NAME))
+    sample = load_sample(SAMPLE_FILE)
+    sample = sample[sample['b_year'] == 2557]
+    provinces = ['33', '52', '66']
+    served = {'s_epi_complete': raw_payloads(sample[sample['areacode'].str[:2].isin(provinces)]),
+              's_epi_extra': raw_payloads(sample[sample['areacode'].str[:2] == '52'])}
+    requests = []
+
+    def source(table, year, province_code):
+        requests.append((table, province_code))
+        return served[table].get((year, province_code))
+
+    # Row counts from an earlier run set the order; revalidation sends every unit to the API anyway
+    cache = ResponseCache(str(tmp_path / 'cache'), revalidate='row_count')
+    previous = {('s_epi_complete', '33'): 5, ('s_epi_complete', '52'): 1, ('s_epi_complete', '66'): 3,
+                ('s_epi_extra', '33'): 2, ('s_epi_extra', '52'): 4, ('s_epi_extra', '66'): 0}
+    for (table, province_code), rows in previous.items():
+        cache.put(table, 2557, province_code, json.dumps([{}] * rows).encode())
+
+    with running_mock_api(MockApi(source)) as url:
+        monkeypatch.setattr(async_fetch, 'API_URL', url)
+        # One request at a time, so they reach the API in scheduled order
+        results = fetch_catalog(['s_epi_complete', 's_epi_extra'], [2557], provinces, max_concurrency=1, cache=cache)
+    assert requests == sorted(previous, key=lambda unit: -previous[unit])
+    assert [table for table, _ in requests] == ['s_epi_complete', 's_epi_extra', 's_epi_complete',
+                                                's_epi_extra', 's_epi_complete', 's_epi_extra']
+
+    publish_tables(results, [2557], provinces)
+    for table, payloads in served.items():
+        written = pd.read_csv(f'{table}_data_all.csv', dtype={'areacode': str})
+        assert len(written) == sum(len(json.loads(payload)) for payload in payloads.values())
+        assert PartitionLedger(CATALOG[table].ledger_file).expected([2557], provinces)
@@ -0,0 +1,100 @@
+import argparse
+import os
+
+import pytest
+
+import cli
+import optimized_fetch_data
+from cli import STORE_DIR, format_years, main, parse_provinces, parse_years
+from drive_io import NIGHTLY_UPLOADS, PUBLISHED_FILES
+from fiscal_units import EXCLUDED_PROVINCES, FIRST_YEAR_BE, get_current_year_be, get_province_codes
+from optimized_fetch_data import ALL_YEARS_FILE, DAILY_FILE, fetch_data_and_save
+from synthetic_data import load_sample
+
+from conftest import SAMPLE_FILE
+
+def test_parse_years():
+    current_year = get_current_year_be()
+    assert parse_years('2560') == [2560]
+    assert parse_years('2557-2559') == [2557, 2558, 2559]
+    assert parse_years('2565, 2560,2564-2566') == [2560, 2564, 2565, 2566]
+    assert parse_years('current') == [current_year]
+    assert parse_years('closed') == list(range(FIRST_YEAR_BE, current_year))
+    assert parse_years('all') == parse_years('closed') + [current_year]
+
+@pytest.mark.parametrize('text', ['25x0', '2560-', '2559-2557', str(FIRST_YEAR_BE - 1), str(get_current_year_be() + 1)])
+def test_parse_years_rejects(text):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_years(text)
+
+def test_parse_provinces():
+    assert parse_provinces('50') == ['50']
+    assert parse_provinces('90, 11,50,11') == ['11', '50', '90']
+    assert parse_provinces('all') == get_province_codes()
+
+@pytest.mark.parametrize('text', ['99', ',', sorted(EXCLUDED_PROVINCES)[0], '10,abc'])
+def test_parse_provinces_rejects(text):
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_provinces(text)
+
+def test_format_years():
+    assert format_years([2557, 2558, 2559, 2562]) == '2557-2559, 2562'
+    assert format_years([2560]) == '2560'
+    assert format_years([]) == 'none'
+
+def test_argument_errors_exit(capsys):
+    with pytest.raises(SystemExit):
+        main(['fetch', '--years', '2500'])
+    assert 'years must lie within' in capsys.readouterr().err
+
+def test_upload_defaults_to_the_nightly_files(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    main(['upload', '--dry-run'])
+    out = capsys.readouterr().out
+    assert all(PUBLISHED_FILES[name][0] in out for name in NIGHTLY_UPLOADS)
+
+    uploaded = []
+    monkeypatch.setattr(cli, 'build_drive_service', lambda: None)
+    monkeypatch.setattr(cli, 'upload_file', lambda service, filename, *args: uploaded.append(filename))
+    main(['upload'])
+    assert uploaded == [PUBLISHED_FILES[name][0] for name in NIGHTLY_UPLOADS]
+    main(['upload', 'raw'])
+    assert uploaded[-1] == PUBLISHED_FILES['raw'][0]
+
+def test_upload_rejects_unknown_files(capsys):
+    with pytest.raises(SystemExit):
+        main(['upload', 'daily', 'bogus', '--dry-run'])
+    assert 'unknown file(s) bogus' in capsys.readouterr().err
+
+def test_province_refresh_needs_a_seeded_store(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(SystemExit) as error:
+        main(['run-all', '--years', '2560-2561', '--provinces', '50', '--dry-run'])
+    assert '2560-2561' in str(error.value)
+
+    os.makedirs(os.path.join(STORE_DIR, 'raw'))
+    for year in (2560, 2561):
+        open(os.path.join(STORE_DIR, 'raw', f'b_year={year}.parquet'), 'w').close()
+    main(['run-all', '--years', '2560-2561', '--provinces', '50', '--dry-run', '--no-upload'])
+    assert 'Provinces: 1 (50)' in capsys.readouterr().out
+
+def test_fetch_data_and_save_refuses_unseeded_years(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(ValueError, match='2560'):
+        fetch_data_and_save(years=[2560], province_codes=['50'])
+
+def test_run_all_without_the_current_year_leaves_the_daily_file(serve_raw, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    serve_raw(load_sample(SAMPLE_FILE))
+    with open(DAILY_FILE, 'w') as f:
+        f.write('yesterday\n')
+    uploaded = []
+    monkeypatch.setattr(optimized_fetch_data, 'upload_to_drive', lambda filename, *args: uploaded.append(filename))
+
+    main(['run-all', '--years', '2560'])
+    assert open(DAILY_FILE).read() == 'yesterday\n'
+    assert os.path.getsize(ALL_YEARS_FILE)
+    assert DAILY_FILE not in uploaded and ALL_YEARS_FILE in uploaded
+
+    assert fetch_data_and_save(years=[get_current_year_be()]) == ['daily', 'all-years', 'rollup']
+    assert open(DAILY_FILE).read() != 'yesterday\n'
@@ -0,0 +1,58 @@
+import os
+
+import pandas as pd
+
+from columnar_output import UNKNOWN_REPORT, ParquetSink, read_parquet_dataset, save_parquet_dataset
+from reshape import reshape_wide_to_long
+from streaming_pipeline import CsvSink, TeeSink
+
+def test_dataset_reads_back_unfiltered(sample_raw, tmp_path):
+    # The sample has a row with a null id, i.e. a null report_name after the reshape
+    long_df = reshape_wide_to_long(sample_raw)
+    unreported = int(long_df['report_name'].isna().sum())
+    assert unreported
+    root_dir = str(tmp_path / 'dataset')
+    save_parquet_dataset(long_df, root_dir)
+
+    assert sorted(os.listdir(root_dir)) == [f'b_year={year}' for year in sorted(long_df['b_year'].unique())]
+    for year_dir in os.listdir(root_dir):
+        assert all(name.startswith('report_name=') and 'HIVE_DEFAULT' not in name
+                   for name in os.listdir(os.path.join(root_dir, year_dir)))
+
+    dataset = read_parquet_dataset(root_dir)
+    assert len(dataset) == len(long_df)
+    assert set(dataset['report_name'].astype(str)) == set(long_df['report_name'].dropna().astype(str)) | {UNKNOWN_REPORT}
+    assert (dataset['report_name'] == UNKNOWN_REPORT).sum() == unreported
+    assert dataset['result'].sum() == long_df['result'].sum()
+
+def test_partition_filter_opens_one_partition(sample_raw, tmp_path):
+    long_df = reshape_wide_to_long(sample_raw)
+    root_dir = str(tmp_path / 'dataset')
+    sink = ParquetSink(root_dir)
+    # Written in two chunks: each becomes a row group of the same partition files
+    half = len(long_df) // 2
+    sink.write(long_df.iloc[:half])
+    sink.write(long_df.iloc[half:])
+    sink.close()
+
+    year = int(long_df['b_year'].max())
+    expected = long_df[(long_df['b_year'] == year) & (long_df['report_name'] == '1yr')]
+    dataset = read_parquet_dataset(root_dir, filters=[('b_year', '=', year), ('report_name', '=', '1yr')])
+    assert len(dataset) == len(expected)
+    assert sink.rows_written == len(long_df)
+
+def test_csv_and_parquet_hold_the_same_rows(sample_raw, tmp_path):
+    # Both sinks of the streaming pipeline get the same chunks, null-report rows included
+    long_df = reshape_wide_to_long(sample_raw)
+    csv_file = str(tmp_path / 'data.csv')
+    root_dir = str(tmp_path / 'dataset')
+    sink = TeeSink(CsvSink(csv_file), ParquetSink(root_dir))
+    half = len(long_df) // 2
+    sink.write(long_df.iloc[:half])
+    sink.write(long_df.iloc[half:])
+    sink.close()
+
+    csv_rows = pd.read_csv(csv_file, dtype=str)
+    dataset = read_parquet_dataset(root_dir)
+    assert len(csv_rows) == len(dataset) == len(long_df)
+    assert (dataset['report_name'] == UNKNOWN_REPORT).sum() == csv_rows['report_name'].isna().sum()
@@ -0,0 +1,72 @@
+import asyncio
+import csv
+import json
+import os
+import sys
+
+import pytest
+from aiohttp import web
+
+from conftest import ROOT_DIR
+from mock_api import running_mock_api
+
+# The scrapers live in search_{} next to their helper modules
+sys.path.insert(0, os.path.join(ROOT_DIR, 'search_{}'))
+import healthgate_scraper
+
+class TambonSearch:
+    # Stand-in for the healthgate tambon search: rows per province as JSON, 404 for a failing one
+    def __init__(self, rows):
+        self.rows = rows
+        self.failing = set()
+
+    async def handle(self, request):
+        province = request.query['province']
+        if province in self.failing:
+            return web.Response(status=404)
+        return web.json_response(self.rows[province])
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/search/tambon', self.handle)
+        return app
+
+def parse_json_rows(body):
+    return json.loads(body)
+
+@pytest.fixture
+def tambon_search(monkeypatch):
+    search = TambonSearch({'A': [['A', 'a1', 't1', '1001'], ['A', 'a1', 't2', '1002']],
+                           'B': [['B', 'b1', 't1', '2001']]})
+    with running_mock_api(search) as url:
+        base_url = url.rsplit('/api/', 1)[0]
+        config = dict(healthgate_scraper.ENDPOINTS['tambon'], url=f'{base_url}/search/tambon?province={{}}')
+        monkeypatch.setitem(healthgate_scraper.ENDPOINTS, 'tambon', config)
+        yield search
+
+def scrape(tmp_path, output_file):
+    return asyncio.run(healthgate_scraper.scrape_async('tambon', str(output_file), min_interval=0, provinces=['A', 'B'],
+                                                       parse_rows=parse_json_rows, snapshot_dir=str(tmp_path / 'snapshots')))
+
+def read_rows(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return sorted(map(tuple, list(csv.reader(f))[1:]))
+
+def test_failed_province_keeps_its_last_snapshot(tambon_search, tmp_path):
+    output_file = tmp_path / 'search_tambon.csv'
+    assert scrape(tmp_path, output_file) == []
+    published = read_rows(output_file)
+    assert len(published) == 3
+
+    tambon_search.failing.add('B')
+    assert scrape(tmp_path, output_file) == ['B']
+    assert read_rows(output_file) == published
+    assert not os.path.exists(str(output_file) + '.tmp')
+
+def test_failed_province_without_snapshot_is_not_published(tambon_search, tmp_path):
+    output_file = tmp_path / 'search_tambon.csv'
+    output_file.write_text('previous\n')
+    tambon_search.failing.add('B')
+    assert scrape(tmp_path, output_file) == ['B']
+    assert output_file.read_text() == 'previous\n'
+    assert not os.path.exists(str(output_file) + '.tmp')
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from columnar_output import read_parquet_dataset, save_parquet_dataset
+from hospital_dim import build_hospital_dimension, load_hospital_dimension
+from reshape import reshape_wide_to_long
+from rollup import HEALTH_REGION_BY_PROVINCE
+
+def build(tmp_path):
+    # selected_office.csv is generated from the registry under material/ on the way
+    return build_hospital_dimension(office_file=str(tmp_path / 'selected_office.csv'),
+                                    dimension_file=str(tmp_path / 'hospital_dim.csv'))
+
+def test_dimension_from_the_committed_registry(tmp_path):
+    dimension = build(tmp_path)
+    table = dimension.table
+    assert table['hospcode'].is_unique
+    assert (table['hosp_key'].to_numpy() == np.arange(len(table))).all()
+    known = table[table['provcode'].notna()]
+    assert len(known) > 0.9 * len(table)
+    assert (known['region'] == known['provcode'].map(HEALTH_REGION_BY_PROVINCE)).all()
+    assert (known['distcode'].str[:2] == known['provcode']).all()
+
+    reloaded = load_hospital_dimension(str(tmp_path / 'hospital_dim.csv'))
+    pd.testing.assert_frame_equal(reloaded.table, table, check_dtype=False)
+
+def test_enrich_takes_attributes_by_hospcode(sample_raw, tmp_path):
+    dimension = build(tmp_path)
+    long_df = reshape_wide_to_long(sample_raw)
+    enriched = dimension.enrich(long_df)
+    assert len(enriched) == len(long_df)
+
+    by_hospcode = dimension.table.set_index('hospcode')
+    found = enriched['hosp_key'] >= 0
+    assert found.any()
+    rows = enriched[found]
+    expected = by_hospcode.loc[rows['hospcode'].astype(str), ['hosp_key', 'region', 'type']]
+    assert (rows['hosp_key'].to_numpy() == expected['hosp_key'].to_numpy()).all()
+    assert (rows['region'].astype(object).fillna('').to_numpy() == expected['region'].fillna('').to_numpy()).all()
+    assert enriched.loc[~found, 'region'].isna().all()
+
+    # The enriched columns go through the Parquet sink like the rest
+    save_parquet_dataset(enriched, str(tmp_path / 'dataset'))
+    dataset = read_parquet_dataset(str(tmp_path / 'dataset'), columns=['hosp_key', 'region'])
+    assert len(dataset) == len(long_df)
+
+def test_unknown_hospcodes_get_no_key(tmp_path):
+    dimension = build(tmp_path)
+    keys = dimension.keys_for(pd.Series(['99999x', None, dimension.table['hospcode'][3]]))
+    assert keys.tolist() == [-1, -1, 3]
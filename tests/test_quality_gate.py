@@ -0,0 +1,104 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+import optimized_yearly_fetch_data4
+from columnar_output import read_parquet_dataset
+from quality_gate import PartitionLedger, QualityError, QualityGate, check_raw
+from response_cache import DEFAULT_CACHE_DIR
+from rollup import DEFAULT_ROLLUP_FILE
+from synthetic_data import load_sample
+
+from conftest import SAMPLE_FILE
+
+def test_sample_passes(sample_raw):
+    # Its one null-id row is within the missing_report_id slack
+    report = check_raw(sample_raw).report()
+    assert report['passed']
+    assert report['checks']['missing_report_id']['rows'] == 1
+
+@pytest.mark.parametrize('check, corrupt', [
+    ('duplicate_key', lambda raw: pd.concat([raw, raw.iloc[[0]]], ignore_index=True)),
+    ('result_over_target', lambda raw: raw.assign(result=raw['target'] + 1)),
+    ('negative_count', lambda raw: raw.assign(target10=-1)),
+    ('malformed_areacode', lambda raw: raw.assign(areacode=raw['areacode'].str[:6])),
+    ('unknown_province', lambda raw: raw.assign(areacode='99' + raw['areacode'].str[2:])),
+    ('unknown_district', lambda raw: raw.assign(areacode=raw['areacode'].str[:2] + '00' + raw['areacode'].str[4:])),
+])
+def test_corrupt_rows_fail(sample_raw, check, corrupt):
+    with pytest.raises(QualityError) as error:
+        check_raw(corrupt(sample_raw.copy()))
+    report = error.value.report
+    assert report['checks'][check]['failed']
+    assert report['checks'][check]['samples']
+
+def test_gate_over_chunks_matches_one_pass(sample_raw):
+    # The streaming pipeline adds the rows unit by unit; a duplicate split across chunks still counts
+    raw = pd.concat([sample_raw, sample_raw.iloc[[5]]], ignore_index=True)
+    gate = QualityGate()
+    for start in range(0, len(raw), len(raw) // 3):
+        gate.add(raw.iloc[start:start + len(raw) // 3])
+    one_pass = QualityGate()
+    one_pass.add(raw)
+    assert gate.counts['duplicate_key'] == one_pass.counts['duplicate_key'] == 1
+    assert gate.counts == one_pass.counts
+    assert gate.partitions == one_pass.partitions
+
+def test_ledger_flags_missing_partitions(sample_raw, tmp_path):
+    ledger = PartitionLedger(str(tmp_path / 'partitions.json'))
+    province_codes = sorted(sample_raw['areacode'].str[:2].unique())
+    years = sorted(int(year) for year in sample_raw['b_year'].unique())
+    ledger.record(check_raw(sample_raw).partitions, years, province_codes)
+
+    # Next run: one province returned nothing
+    dropped = province_codes[0]
+    fewer = sample_raw[sample_raw['areacode'].str[:2] != dropped]
+    expected = PartitionLedger(ledger.path).expected(years, province_codes)
+    with pytest.raises(QualityError) as error:
+        check_raw(fewer, expected)
+    assert error.value.report['checks']['missing_partition']['failed']
+    assert all(sample.endswith('/' + dropped) for sample in error.value.report['checks']['missing_partition']['samples'])
+    # A run that only covered the other provinces expects only their partitions
+    others = [code for code in province_codes if code != dropped]
+    assert check_raw(fewer, ledger.expected(years, others)).report()['passed']
+
+@pytest.fixture
+def yearly_run(serve_raw, monkeypatch, tmp_path):
+    # fetch_transform_and_save over fiscal years 2557-2558 and a few of the sample's provinces,
+    # writing into tmp_path. Served without the sample's null-id row: in just these years it is over
+    # the 1% slack.
+    province_codes = sorted(load_sample(SAMPLE_FILE)['areacode'].str[:2].unique())[:6]
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(optimized_yearly_fetch_data4, 'get_current_year_be', lambda: 2559)
+    monkeypatch.setattr(optimized_yearly_fetch_data4, 'get_province_codes', lambda: province_codes)
+    def run(raw):
+        # Closed years would otherwise be replayed from the previous run's response cache
+        shutil.rmtree(DEFAULT_CACHE_DIR, ignore_errors=True)
+        serve_raw(raw[raw['id'].notna()])
+        optimized_yearly_fetch_data4.fetch_transform_and_save('long.csv', parquet_dir='dataset', max_concurrency=4)
+    return run
+
+def test_failed_gate_publishes_nothing(yearly_run, tmp_path):
+    sample = load_sample(SAMPLE_FILE)
+    yearly_run(sample)
+    published = {name: os.path.getmtime(tmp_path / name) for name in ['long.csv', DEFAULT_ROLLUP_FILE, 'dataset']}
+    long_rows = len(pd.read_csv(tmp_path / 'long.csv'))
+
+    with pytest.raises(QualityError):
+        yearly_run(sample.assign(result=sample['target'] + 1))
+    assert {name: os.path.getmtime(tmp_path / name) for name in published} == published
+    assert len(pd.read_csv(tmp_path / 'long.csv')) == long_rows
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+def test_passed_gate_publishes_staged_outputs(yearly_run, tmp_path):
+    sample = load_sample(SAMPLE_FILE)
+    yearly_run(sample)
+    written = pd.read_csv(tmp_path / 'long.csv')
+    dataset = read_parquet_dataset(str(tmp_path / 'dataset'))
+    assert len(dataset) == len(written) > 0
+    assert set(dataset['b_year'].astype(int)) <= {2557, 2558}
+    assert os.path.exists(tmp_path / DEFAULT_ROLLUP_FILE)
+    assert PartitionLedger().years
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
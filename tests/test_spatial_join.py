@@ -0,0 +1,35 @@
+import json
+
+import pandas as pd
+
+import spatial_join
+from spatial_join import check_hospital_locations
+
+def square(x, y):
+    return {'type': 'Polygon', 'coordinates': [[[x, y], [x + 1, y], [x + 1, y + 1], [x, y + 1], [x, y]]]}
+
+def district_layer(tmp_path, monkeypatch):
+    path = tmp_path / 'districts.geojson'
+    features = [{'type': 'Feature', 'geometry': square(100, 13), 'properties': {'id': '5001'}},
+                {'type': 'Feature', 'geometry': square(101, 13), 'properties': {'id': '5002'}}]
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': features}))
+    monkeypatch.setitem(spatial_join.LAYERS, 'district', dict(spatial_join.LAYERS['district'], path=str(path)))
+
+def test_points_are_checked_against_their_areacode(tmp_path, monkeypatch):
+    district_layer(tmp_path, monkeypatch)
+    hospitals = pd.DataFrame({'lon': [100.5, 101.5, 101.5, 105.0, 100.5],
+                              'lat': [13.5, 13.5, 13.5, 13.5, 13.5],
+                              'areacode': ['50010201', '50020301', '50010201', '50010201', None]})
+    report = check_hospital_locations(hospitals)
+    assert report['polygon_code'].fillna('').tolist() == ['5001', '5002', '5002', '', '5001']
+    assert report['status'].tolist() == ['ok', 'ok', 'mismatch', 'outside', 'no_areacode']
+
+def test_areacodes_come_from_the_epi_rows(tmp_path, monkeypatch):
+    # A hospital list with coordinates only: each hospcode takes the areacode it reports most often
+    district_layer(tmp_path, monkeypatch)
+    hospitals = pd.DataFrame({'hospcode': ['00001', '00002', '00003'], 'lon': [100.5, 100.5, 101.5], 'lat': [13.5, 13.5, 13.5]})
+    long_df = pd.DataFrame({'hospcode': pd.Categorical(['00001', '00001', '00001', '00002', '00002']),
+                            'areacode': pd.Categorical(['50010101', '50010101', '50020101', '50020101', '50020101'])})
+    report = check_hospital_locations(hospitals, long_df=long_df)
+    assert report['areacode'].fillna('').tolist() == ['50010101', '50020101', '']
+    assert report['status'].tolist() == ['ok', 'mismatch', 'no_areacode']
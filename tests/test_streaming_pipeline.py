@@ -0,0 +1,30 @@
+import pandas as pd
+
+from reshape import reshape_wide_to_long
+from streaming_pipeline import CsvSink, run_streaming_pipeline
+from synthetic_data import load_sample
+
+from conftest import SAMPLE_FILE
+
+def test_pipeline_streams_every_unit_to_the_sink(serve_raw, tmp_path):
+    sample = load_sample(SAMPLE_FILE)
+    mock = serve_raw(sample)
+    # 2557/10 has no rows in the sample, so one unit comes back as []
+    years, province_codes = [2557], ['10', '19', '30']
+    filename = str(tmp_path / 'long.csv')
+    sink = CsvSink(filename)
+    run_streaming_pipeline(reshape_wide_to_long, sink, years=years, province_codes=province_codes,
+                           max_concurrency=2)
+    assert mock.stats['ok'] == len(years) * len(province_codes)
+
+    in_units = (sample['b_year'] == 2557) & sample['areacode'].str[:2].isin(province_codes)
+    expected = reshape_wide_to_long(sample[in_units].reset_index(drop=True))
+    written = pd.read_csv(filename, dtype={'hospcode': str, 'areacode': str})
+    assert sink.rows_written == len(written) == len(expected)
+    assert written['result'].sum() == expected['result'].sum()
+
+def test_pipeline_with_only_empty_units(serve_raw, tmp_path):
+    serve_raw(load_sample(SAMPLE_FILE))
+    sink = CsvSink(str(tmp_path / 'long.csv'))
+    run_streaming_pipeline(reshape_wide_to_long, sink, years=[2557], province_codes=['10', '11'])
+    assert sink.rows_written == 0
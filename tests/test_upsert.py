@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+
+from upsert import HASH_COLUMN, RawStore, merge_year
+
+def test_merge_identical_rows_is_a_no_op(sample_raw):
+    # The sample holds a row with a null id; matching it against itself is not a hash collision
+    assert sample_raw['id'].isna().any()
+    stored, counts = merge_year(None, sample_raw)
+    assert counts['inserted'] == len(sample_raw)
+
+    merged, counts = merge_year(stored, sample_raw, prune=True)
+    assert merged is None
+    assert counts == {'inserted': 0, 'updated': 0, 'deleted': 0, 'unchanged': len(sample_raw)}
+
+def test_merge_updates_changed_date_com_and_prunes_missing_rows(sample_raw):
+    stored, _ = merge_year(None, sample_raw)
+    incoming = sample_raw.iloc[1:].copy()
+    incoming.loc[incoming.index[0], 'date_com'] += 1
+
+    merged, counts = merge_year(stored, incoming, prune=True)
+    assert counts == {'inserted': 0, 'updated': 1, 'deleted': 1, 'unchanged': len(sample_raw) - 2}
+    assert len(merged) == len(sample_raw) - 1
+    assert merged[HASH_COLUMN].is_unique
+
+def test_partial_prune_only_deletes_rows_in_scope(sample_raw):
+    # A refresh of province 40 alone that no longer returns one of its rows
+    stored, _ = merge_year(None, sample_raw)
+    in_scope = stored['areacode'].astype(str).str.startswith('40').to_numpy()
+    incoming = sample_raw[sample_raw['areacode'].astype(str).str.startswith('40')].iloc[1:]
+
+    merged, counts = merge_year(stored, incoming, prune=in_scope)
+    assert counts['deleted'] == 1
+    assert len(merged) == len(sample_raw) - 1
+    # Every other province's rows were absent from the refresh and are all kept
+    assert (~merged['areacode'].astype(str).str.startswith('40')).sum() == (~in_scope).sum()
+
+def test_store_round_trip(tmp_path, sample_raw):
+    store = RawStore(str(tmp_path / 'store'))
+    changed = store.upsert(sample_raw, prune_years=sample_raw['b_year'].unique())
+    assert sorted(changed) == store.years()
+    # A second run over the same rows rewrites nothing
+    assert store.upsert(sample_raw, prune_years=store.years()) == {}
+    assert sum(len(store.read_year(year)) for year in store.years()) == len(sample_raw)
+
+def test_merge_rejects_repeated_keys(sample_raw):
+    repeated = pd.concat([sample_raw, sample_raw.iloc[:1]], ignore_index=True)
+    with pytest.raises(ValueError):
+        merge_year(None, repeated)
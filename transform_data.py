@@ -1,112 +1,89 @@
+import argparse
+
 import pandas as pd
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload, MediaFileUpload
-import io
+
+from drive_io import DEFAULT_CHUNK_SIZE
+from drive_io import download_file as drive_download_file
+from drive_io import upload_file as drive_upload_file
+from reshape import reshape_wide_to_long
+from schema import RAW_CSV_DTYPES, apply_raw_schema, memory_report
+
+DEFAULT_ROW_CHUNK = 200000  # raw rows per transform chunk (x12 months in the output)
 
 # Google Drive service build
 def google_drive_service():
+    from google.oauth2.service_account import Credentials
+    from googleapiclient.discovery import build
+
     print("Building Google Drive service...")
     credentials = Credentials.from_service_account_file('gcp_service_account.json')
     service = build('drive', 'v3', credentials=credentials)
     print("Google Drive service built successfully.")
     return service
 
-# Download file from Google Drive
-def download_file(service, file_id, file_path):
+# Download file from Google Drive, streamed straight to disk in fixed-size chunks
+def download_file(service, file_id, file_path, chunk_size=DEFAULT_CHUNK_SIZE):
     print(f"Downloading file with ID {file_id}...")
-    request = service.files().get_media(fileId=file_id)
-    fh = io.BytesIO()
-    downloader = MediaIoBaseDownload(fh, request)
-    done = False
-    while not done:
-        _, done = downloader.next_chunk()
-    fh.seek(0)
-    with open(file_path, 'wb') as f:
-        f.write(fh.read())
+    drive_download_file(service, file_id, file_path, chunk_size=chunk_size)
     print("File downloaded successfully.")
 
-# Upload or Update file to Google Drive
-def upload_file(service, file_path, folder_id, file_id=None):
-    file_metadata = {
-        'name': file_path.split('/')[-1],
-        'parents': [folder_id]
-    }
-    media = MediaFileUpload(file_path, mimetype='text/csv')
-    if file_id:
-        # Check if file exists
-        print(f"Checking if file with ID {file_id} exists...")
-        try:
-            service.files().get(fileId=file_id).execute()
-            print("File exists, updating...")
-            service.files().update(fileId=file_id, body=file_metadata, media_body=media, fields='id').execute()
-            print(f"File with ID {file_id} updated successfully.")
-        except Exception as e:
-            print(f"File does not exist or an error occurred: {e}. Creating new file...")
-            file_id = None
-
-    if not file_id:
-        file = service.files().create(body=file_metadata, media_body=media, fields='id').execute()
-        print(f"New file created with ID: {file.get('id')}")
-
-def map_column_to_date(b_year, column):
-    ce_year = b_year - 543
-    month_num = int(column[-2:])
-    if month_num >= 10:
-        year = ce_year - 1
-    else:
-        year = ce_year
-    return f"{year}-{str(month_num).zfill(2)}-01"
+# Upload or Update file to Google Drive (resumable, chunked, skipped when unchanged)
+def upload_file(service, file_path, folder_id, file_id=None, chunk_size=DEFAULT_CHUNK_SIZE, compress=False):
+    drive_upload_file(service, file_path, folder_id, file_id, chunk_size=chunk_size, compress=compress)
 
 # Transformation logic
-def transform_data(file_path):
+def transform_data(file_path, processes=1):
     print("Transforming data...")
-    df = pd.read_csv(file_path)
-
-    # Mapping IDs to names with print step
-    print("Mapping IDs to report names...")
-    id_to_name = {
-        "28dd2c7955ce926456240b2ff0100bde": "1yr",
-        "35f4a8d465e6e1edc05f3d8ab658c551": "2yr",
-        "d1fe173d08e959397adf34b1d77e88d7": "3yr",
-        "f033ab37c30201f73f142449d037028d": "5yr",
-        "30f72fc853a2cc02ef953dc97f36f596": "7yr"
-    }
-    df['report_name'] = df['id'].map(id_to_name)
-    print("ID to report name mapping completed.")
-
-    # Converting 'b_year' to integer with print step
-    print("Converting budget year to integer...")
-    df['b_year'] = df['b_year'].astype(int)
-    print("Budget year conversion completed.")
-
-    optimized_df_all = pd.DataFrame()
-    print("Starting monthly data transformation...")
-    
-    for month in range(1, 13):
-        print(f"Processing month: {month}")
-        target_col = f'target{str(month).zfill(2)}'
-        result_col = f'result{str(month).zfill(2)}'
-        date_col = df['b_year'].apply(lambda x: map_column_to_date(x, target_col))
-        temp_df = df[['report_name', 'hospcode', 'areacode', 'b_year']].copy()
-        temp_df['date'] = date_col
-        temp_df['target'] = df[target_col]
-        temp_df['result'] = df[result_col]
-        optimized_df_all = pd.concat([optimized_df_all, temp_df], ignore_index=True)
-        print(f"Month {month} processed.")
+    df = apply_raw_schema(pd.read_csv(file_path, dtype=RAW_CSV_DTYPES))
+    memory_report(df, "raw")
 
-    print("Monthly data transformation completed.")
+    # Mapping IDs to report names and reshaping all 12 months in one vectorized pass,
+    # one fiscal year per process when processes > 1 (None = every core)
+    print("Reshaping monthly columns to long format...")
+    if processes == 1:
+        optimized_df_all = reshape_wide_to_long(df)
+    else:
+        # The process pool moves partitions as Arrow buffers; pyarrow is only needed here
+        from parallel_reshape import reshape_parallel
 
-    # Cleaning up the data
-    print("Cleaning up data...")
-    optimized_df_all.dropna(subset=['target', 'result'], inplace=True)
-    optimized_df_all['target'] = optimized_df_all['target'].astype(int)
-    optimized_df_all['result'] = optimized_df_all['result'].astype(int)
-    print("Data cleanup completed.")
+        optimized_df_all = reshape_parallel(df, processes)
+    memory_report(optimized_df_all, "long")
+    print("Monthly data transformation completed.")
 
     return optimized_df_all
 
-def main():
+# Chunked transformation: reads the raw CSV a block of rows at a time and appends
+# each reshaped block to the output, so memory stays flat however many years exist
+def transform_file(file_path, output_path, chunksize=DEFAULT_ROW_CHUNK):
+    print(f"Transforming data in chunks of {chunksize} rows...")
+    rows_written = 0
+    with pd.read_csv(file_path, chunksize=chunksize, dtype=RAW_CSV_DTYPES) as reader:
+        for i, chunk in enumerate(reader):
+            transformed = reshape_wide_to_long(chunk)
+            transformed.to_csv(output_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+            rows_written += len(transformed)
+            print(f"Chunk {i + 1} processed ({rows_written} rows written).")
+    print("Monthly data transformation completed.")
+    return rows_written
+
+# Parallel transformation: the raw CSV is read once and every fiscal year is reshaped and
+# CSV-encoded in its own process, which is where nearly all of the transform time goes
+def transform_file_parallel(file_path, output_path, processes=None, partition_by='year'):
+    from parallel_reshape import write_csv_parallel
+
+    print("Transforming data by fiscal year across processes...")
+    df = apply_raw_schema(pd.read_csv(file_path, dtype=RAW_CSV_DTYPES))
+    rows_written = write_csv_parallel(df, output_path, processes, partition_by)
+    print(f"Monthly data transformation completed ({rows_written} rows written).")
+    return rows_written
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rebuild the long-format all-years CSV from the raw one on Drive.')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='one fiscal year per process (0 = every core): faster, but the whole raw file '
+                             'and its output are held in memory; default 1 transforms in chunks with flat memory')
+    args = parser.parse_args(argv)
+
     service = google_drive_service()
     
     # Download the file
@@ -114,12 +91,13 @@ def main():
     file_path = 's_epi_complete_data_all.csv'
     download_file(service, file_id, file_path)
     
-    # Transform the data
-    transformed_df = transform_data(file_path)
-    
-    # Save the transformed data to a new file
+    # Transform the data and save it to a new file: chunk by chunk with flat memory, or with
+    # --processes one fiscal year per process, faster but with the whole file in memory
     transformed_file_path = 'optimized_s_epi_complete_data_all.csv'
-    transformed_df.to_csv(transformed_file_path, index=False)
+    if args.processes == 1:
+        transform_file(file_path, transformed_file_path)
+    else:
+        transform_file_parallel(file_path, transformed_file_path, args.processes or None)
     print("Transformed file saved.")
     
     # Upload the transformed file
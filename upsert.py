@@ -0,0 +1,173 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from metrics import METRICS, log
+from reshape import LONG_COLUMNS, reshape_wide_to_long
+from schema import apply_raw_schema
+
+DEFAULT_STORE_DIR = 's_epi_complete_store'
+# A raw s_epi_complete row is identified by these; date_com is when HDC last computed it
+UPSERT_KEY = ['id', 'hospcode', 'areacode', 'b_year']
+HASH_COLUMN = '_key_hash'
+HASH_MULTIPLIER = np.uint64(0x100000001B3)  # FNV-1a 64-bit prime, used to fold the column hashes
+
+def _hash_column(values):
+    # uint64 hash per row; a categorical hashes its (few) categories once and maps the codes
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        hashed = pd.util.hash_array(values.cat.categories.astype(str).to_numpy(dtype=object))
+        codes = values.cat.codes.to_numpy()
+        return np.where(codes >= 0, hashed[codes], pd.util.hash_array(np.array(['nan'], dtype=object))[0])
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return pd.util.hash_array(values.to_numpy(dtype=np.int64))
+    return pd.util.hash_array(values.astype(str).to_numpy(dtype=object))
+
+def key_hash(df):
+    # 64-bit hash of UPSERT_KEY per row: the merge index. Codes hash by their text, so
+    # categorical, string and freshly decoded columns of the same key hash alike.
+    combined = np.zeros(len(df), dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for column in UPSERT_KEY:
+            combined = (combined ^ _hash_column(df[column])) * HASH_MULTIPLIER
+    return combined
+
+def _same_keys(left, right):
+    # Compared as text with nulls in the same places counting as equal: the API returns rows
+    # with a null id, and whether astype(str) turns a null into 'nan' depends on the pandas version
+    return all(left[column].astype(str).reset_index(drop=True).equals(right[column].astype(str).reset_index(drop=True))
+               for column in UPSERT_KEY)
+
+def merge_year(stored, incoming, prune=False):
+    # Upserts one fiscal year. Rows are matched on the key hash; a matched row is replaced
+    # only when its date_com differs, unmatched incoming rows are inserted, and with prune
+    # (the incoming rows are the complete year) stored rows missing from them are deleted.
+    # prune may also be a boolean mask over `stored`: the rows the incoming ones cover.
+    # Returns (merged frame or None when nothing changed, counts).
+    incoming = incoming.assign(**{HASH_COLUMN: key_hash(incoming)})
+    # Repeated keys are rejected by the quality gate before any upsert; one getting this far
+    # would leave the stored year with a non-unique merge index
+    if incoming[HASH_COLUMN].duplicated().any():
+        raise ValueError("Incoming s_epi_complete rows repeat an upsert key; run them through the quality gate")
+    if stored is None or stored.empty:
+        counts = {'inserted': len(incoming), 'updated': 0, 'deleted': 0, 'unchanged': 0}
+        return (incoming if len(incoming) else None), counts
+
+    positions = pd.Index(stored[HASH_COLUMN].to_numpy()).get_indexer(incoming[HASH_COLUMN].to_numpy())
+    matched = positions >= 0
+    matched_stored = stored.iloc[positions[matched]]
+    matched_incoming = incoming[matched]
+    if not _same_keys(matched_stored.reset_index(drop=True), matched_incoming.reset_index(drop=True)):
+        raise RuntimeError("Key hash collision while merging s_epi_complete rows")
+
+    # A missing date_com on either side counts as changed
+    same_date = matched_incoming['date_com'].reset_index(drop=True).eq(matched_stored['date_com'].reset_index(drop=True))
+    changed = np.ones(len(incoming), dtype=bool)
+    changed[matched] = ~same_date.fillna(False).to_numpy(dtype=bool)
+    keep = np.ones(len(stored), dtype=bool)
+    keep[positions[matched & changed]] = False  # replaced by their incoming version
+    deleted = 0
+    if prune is not False:
+        covered = np.ones(len(stored), dtype=bool) if prune is True else np.asarray(prune, dtype=bool)
+        stale = covered.copy()
+        stale[positions[matched]] = False
+        deleted = int(stale.sum())
+        keep &= ~stale
+
+    counts = {'inserted': int((~matched).sum()), 'updated': int((matched & changed).sum()), 'deleted': deleted,
+              'unchanged': int((matched & ~changed).sum())}
+    if not changed.any() and not deleted:
+        return None, counts
+    merged = pd.concat([stored[keep], incoming[changed]], ignore_index=True)
+    return apply_raw_schema(merged), counts
+
+class RawStore:
+    # The maintained all-years dataset. Per fiscal year:
+    #   {root}/raw/b_year={year}.parquet   raw rows plus their key hash (the merge index)
+    #   {root}/long/b_year={year}.csv      the year's long-format CSV rows, without header
+    # A nightly upsert rewrites only the years whose rows changed; the published all-years
+    # CSV is the header plus every year's segment in year order.
+    def __init__(self, root_dir=DEFAULT_STORE_DIR):
+        self.root_dir = root_dir
+        os.makedirs(os.path.join(root_dir, 'raw'), exist_ok=True)
+        os.makedirs(os.path.join(root_dir, 'long'), exist_ok=True)
+
+    def _raw_path(self, year):
+        return os.path.join(self.root_dir, 'raw', f'b_year={year}.parquet')
+
+    def _long_path(self, year):
+        return os.path.join(self.root_dir, 'long', f'b_year={year}.csv')
+
+    def years(self):
+        names = os.listdir(os.path.join(self.root_dir, 'raw'))
+        return sorted(int(name[len('b_year='):-len('.parquet')]) for name in names if name.endswith('.parquet'))
+
+    def has_year(self, year):
+        return os.path.exists(self._raw_path(year))
+
+    def read_year(self, year):
+        if not self.has_year(year):
+            return None
+        return apply_raw_schema(pd.read_parquet(self._raw_path(year), engine='pyarrow'))
+
+    def long_year(self, year):
+        # Long-format rows of one stored year
+        stored = self.read_year(year)
+        return reshape_wide_to_long(stored) if stored is not None and len(stored) else pd.DataFrame(columns=LONG_COLUMNS)
+
+    def write_year(self, year, frame):
+        # Raw partition and long segment, each written to a temp file and renamed into place
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        pq.write_table(table, self._raw_path(year) + '.tmp', compression='zstd')
+        os.replace(self._raw_path(year) + '.tmp', self._raw_path(year))
+        long_df = reshape_wide_to_long(frame) if len(frame) else pd.DataFrame(columns=LONG_COLUMNS)
+        long_df.to_csv(self._long_path(year) + '.tmp', index=False, header=False)
+        os.replace(self._long_path(year) + '.tmp', self._long_path(year))
+        return long_df
+
+    def upsert(self, incoming, prune_years=(), provinces=None):
+        # Merges freshly fetched raw rows year by year. prune_years are the years fetched in
+        # full, whose stored rows may be deleted when they no longer come back; with
+        # `provinces` (a partial refresh) only those provinces' stored rows can be.
+        # Returns {year: long frame} for every year that was rewritten.
+        incoming = apply_raw_schema(incoming)
+        prune_years = set(int(year) for year in prune_years)
+        fetched_years = set(prune_years)
+        if len(incoming):
+            fetched_years |= set(int(year) for year in incoming['b_year'].unique())
+        changed = {}
+        for year in sorted(fetched_years):
+            rows = incoming[incoming['b_year'] == year] if len(incoming) else incoming
+            if rows.empty:
+                # A whole year coming back empty is far likelier an API fault than every row withdrawn
+                log(f"Upsert: no rows fetched for b_year {year}, stored rows kept.", level='warning')
+                continue
+            stored = self.read_year(year)
+            prune = year in prune_years
+            if prune and provinces is not None and stored is not None:
+                prune = stored['areacode'].astype(str).str[:2].isin(list(provinces)).to_numpy()
+            merged, counts = merge_year(stored, rows, prune=prune)
+            for kind, count in counts.items():
+                METRICS.increment('upsert_rows', count, kind=kind)
+            if merged is None:
+                continue
+            changed[year] = self.write_year(year, merged)
+            log(f"Upserted b_year {year}: {counts['inserted']} inserted, {counts['updated']} updated, "
+                f"{counts['deleted']} deleted, {counts['unchanged']} unchanged.")
+        if not changed:
+            log("Upsert: no rows changed.")
+        return changed
+
+    def publish_csv(self, filename):
+        # Header plus every year's long segment in year order: a file copy, no re-encoding
+        with open(filename + '.tmp', 'wb') as output:
+            output.write(pd.DataFrame(columns=LONG_COLUMNS).to_csv(index=False).encode('utf-8'))
+            for year in self.years():
+                with open(self._long_path(year), 'rb') as segment:
+                    shutil.copyfileobj(segment, output)
+        os.replace(filename + '.tmp', filename)
+        log(f"Published {filename} from {len(self.years())} fiscal years.")
+        return filename
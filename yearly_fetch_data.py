@@ -1,66 +1,34 @@
-import requests
-import pandas as pd
-import json
-from datetime import datetime
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
-import os
+from async_fetch import fetch_all_data, get_current_year_be, get_province_codes
+from drive_io import DEFAULT_CHUNK_SIZE, build_drive_service, upload_file
+from quality_gate import PartitionLedger, check_raw
+from response_cache import ResponseCache
 
 def fetch_data_and_save():
     # Calculate the current year in the Buddhist Era
-    current_year_be = datetime.now().year + 543
+    current_year_be = get_current_year_be()
 
-    url = "https://opendata.moph.go.th/api/report_data"
-    headers = {"Content-Type": "application/json"}
-    excluded_provinces = ['10', '28', '29', '59', '68', '69', '78', '79', '87', '88', '89']
-    province_codes = [f"{i:02d}" for i in range(11, 97) if f"{i:02d}" not in excluded_provinces]
-    
-    s_epi_complete_data_all = pd.DataFrame()
+    province_codes = get_province_codes()
 
     # Iterate through the years from 2557 to the last year (excluding the current year)
-    for year in range(2557, current_year_be):  # Exclude current year (If want to include the current year use current_year_be +1)
-        for province_code in province_codes:
-            data = {
-                "tableName": "s_epi_complete",
-                "year": str(year),
-                "province": province_code,
-                "type": "json"
-            }
-            response = requests.post(url, headers=headers, data=json.dumps(data))
-            if response.status_code in [200, 201]:
-                temp_df = pd.json_normalize(response.json())
-                s_epi_complete_data_all = pd.concat([s_epi_complete_data_all, temp_df], ignore_index=True)
-            else:
-                print(f"Failed to retrieve data for year {year}, province code {province_code}. Status code: {response.status_code}")
+    # Exclude current year (If want to include the current year use current_year_be +1)
+    # Closed fiscal years are served from the on-disk response cache instead of being re-downloaded;
+    # an interrupted run resumes from its manifest
+    years = range(2557, current_year_be)
+    s_epi_complete_data_all = fetch_all_data(years=years, province_codes=province_codes,
+                                             cache=ResponseCache(), manifest_name='s_epi_complete_yearly')
+
+    # Validate before saving: a failed check raises and nothing is written or uploaded
+    ledger = PartitionLedger()
+    gate = check_raw(s_epi_complete_data_all, ledger.expected(years, province_codes))
 
     s_epi_complete_data_all.to_csv('s_epi_complete_data_all.csv', index=False)
+    ledger.record(gate.partitions, years, province_codes)
     print("Yearly data fetching and saving complete.")
 
-def upload_to_drive(filename, folder_id, file_id=None):
-    service_account_file = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-    credentials = service_account.Credentials.from_service_account_file(service_account_file)
-    service = build('drive', 'v3', credentials=credentials)
-
-    media = MediaFileUpload(filename, mimetype='text/csv')
-
-    if file_id:
-        # Update the existing file
-        updated_file = service.files().update(
-            fileId=file_id,
-            media_body=media,
-            fields='id'
-        ).execute()
-        print(f"Updated {filename} in Google Drive with File ID: {updated_file.get('id')}")
-    else:
-        # Create a new file if no file_id is provided
-        file_metadata = {'name': os.path.basename(filename), 'parents': [folder_id]}
-        file = service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields='id'
-        ).execute()
-        print(f"Uploaded {filename} to Google Drive with File ID: {file.get('id')}")
+def upload_to_drive(filename, folder_id, file_id=None, chunk_size=DEFAULT_CHUNK_SIZE, compress=False):
+    service = build_drive_service()
+    # Resumable chunked upload; skipped entirely when Drive already holds identical bytes (md5Checksum)
+    upload_file(service, filename, folder_id, file_id, chunk_size=chunk_size, compress=compress)
 
 if __name__ == '__main__':
     fetch_data_and_save()